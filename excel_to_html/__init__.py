@@ -1 +1,7 @@
-from .main import main
+from .main import main, iter_html, convert_many, warmup
+from .stats import ConversionStats
+from .cache import HTMLCache
+from .budget import Budget, BudgetExceeded
+from .static_values import VERSION as __version__
+from .incremental import IncrementalRenderer
+from .async_api import AsyncConverter, convert_async
@@ -0,0 +1,197 @@
+from .main import iter_html, check_style_mode, finish_html, to_cached, from_cached
+from .cache import cache_key, content_hash
+import concurrent.futures
+import functools
+import json
+import os
+import threading
+from typing import Dict
+
+
+def convert_blocking(
+    pathname: str,
+    sheetname: str,
+    bounds: tuple,
+    openpyxl_kwargs: Dict,
+    style_mode: str,
+    engine: str,
+    cache=None,
+    cancel_event: threading.Event=None,
+    options: Dict=None
+):
+    """
+    The blocking conversion run by AsyncConverter in its executor. It returns what main.main would, but checks
+    cancel_event before it starts and between rows, so a cancelled conversion stops early. It is a module level function so that it can
+    be sent to a process executor, where cancel_event is None (events cannot be shared with other processes).
+
+    Arguments:
+    pathname, sheetname, openpyxl_kwargs, style_mode, engine, cache: see main.main
+    bounds: a tuple of (min_row, max_row, min_col, max_col)
+    cancel_event: an optional threading.Event, once set the conversion is abandoned
+    options: the trim, collapse_blank_rows, budget and format_values arguments of main.main
+
+    Returns:
+    what main.main returns, or None if the conversion was cancelled
+    """
+    if cancel_event is not None and cancel_event.is_set():  # cancelled while waiting for a thread
+        return None
+    options = options or {}
+    if cache is not None:
+        key = cache_key(content_hash(pathname), sheetname, bounds, openpyxl_kwargs, style_mode, {k: v for k, v in options.items() if k != 'budget'}, engine)
+        hit = cache.get(key)
+        if hit is not None:
+            return from_cached(*hit, style_mode)
+
+    style_classes = None if style_mode in ('inline', 'compact') else {}
+    chunks = []
+    for chunk in iter_html(pathname, sheetname, *bounds, openpyxl_kwargs, style_classes, engine=engine, compact=style_mode == 'compact', **options):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        chunks.append(chunk)
+    result = finish_html(''.join(chunks), style_classes, style_mode)
+
+    if cache is not None:
+        cache.put(key, *to_cached(result, style_mode))
+    return result
+
+
+class AsyncConverter:
+    """
+    Runs conversions from asyncio code without blocking the event loop. The loading, parsing and rendering happen in
+    an executor, at most max_concurrency at a time. Callers asking for the same conversion (the same workbook,
+    sheet, window and options) while it is running share it instead of each starting their own.
+
+    Cancelling a caller only cancels its wait. The conversion itself is cancelled once every caller sharing it has
+    been cancelled: in a thread executor it stops at the next row, in a process executor it is only dropped if it
+    has not started yet. The concurrency limit belongs to the first event loop the converter is used in.
+    """
+
+    def __init__(self, executor: concurrent.futures.Executor=None, max_concurrency: int=None):
+        """
+        Arguments:
+        executor: a concurrent.futures thread or process pool (default: the event loop's default thread pool)
+        max_concurrency: how many conversions can run at once (default: as many as the executor runs)
+        """
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.semaphore = None  # made on first use, inside the running event loop
+        self.in_flight = {}  # conversion key -> {'task', 'cancel_event', 'callers'}
+
+    async def convert(
+        self,
+        pathname: str,
+        sheetname: str='Sheet1',
+        min_row: int=None,
+        max_row: int=None,
+        min_col: int=None,
+        max_col: int=None,
+        openpyxl_kwargs: Dict=None,
+        style_mode: str='inline',
+        cache=None,
+        engine: str='openpyxl',
+        trim: bool=False,
+        collapse_blank_rows: int=None,
+        budget=None,
+        format_values: bool=False
+    ):
+        """
+        Arguments:
+        pathname, sheetname, min_row, max_row, min_col, max_col, openpyxl_kwargs, style_mode, cache, engine, trim,
+            collapse_blank_rows, budget, format_values: see main.main (in a process executor, the peak_memory is set on a copy of budget)
+
+        Returns:
+        what main.main returns
+        """
+        import asyncio  # only imported when needed, see main.import_dependencies, callers have it imported already
+        check_style_mode(style_mode)
+        bounds = (min_row, max_row, min_col, max_col)
+        options = {'trim': trim, 'collapse_blank_rows': collapse_blank_rows, 'budget': budget, 'format_values': format_values}
+        key = (
+            os.path.abspath(pathname),
+            sheetname,
+            bounds,
+            json.dumps(openpyxl_kwargs or {}, sort_keys=True, default=repr),
+            style_mode,
+            engine,
+            trim,
+            collapse_blank_rows,
+            format_values,
+            id(cache),
+            id(budget),
+        )
+        conversion = self.in_flight.get(key)
+        if conversion is None:
+            process_pool = isinstance(self.executor, concurrent.futures.ProcessPoolExecutor)
+            cancel_event = None if process_pool else threading.Event()
+            run = functools.partial(convert_blocking, pathname, sheetname, bounds, openpyxl_kwargs, style_mode, engine, cache, cancel_event, options)
+            conversion = self.in_flight[key] = {
+                'task': asyncio.ensure_future(self.run(run)),
+                'cancel_event': cancel_event,
+                'callers': 0,
+            }
+            conversion['task'].add_done_callback(functools.partial(self.forget, key, conversion))
+
+        conversion['callers'] += 1
+        try:
+            return await asyncio.shield(conversion['task'])
+        finally:
+            conversion['callers'] -= 1
+            if conversion['callers'] == 0 and not conversion['task'].done():  # every caller was cancelled
+                if conversion['cancel_event'] is not None:
+                    conversion['cancel_event'].set()
+                conversion['task'].cancel()
+
+    async def run(self, run):
+        """
+        Runs a blocking conversion in the executor, once there is room under max_concurrency. The room is only given
+        back once the executor is done with the conversion: a cancelled conversion keeps running until it notices
+        cancel_event, and until then it still counts against max_concurrency.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self.max_concurrency is None:
+            return await loop.run_in_executor(self.executor, run)
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self.semaphore.acquire()
+        try:
+            if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):  # cancelling it drops it if it has not started yet
+                submitted = self.executor.submit(run)
+                submitted.add_done_callback(lambda submitted: loop.call_soon_threadsafe(self.release, submitted))
+                future = asyncio.wrap_future(submitted)
+            else:  # a thread cannot be stopped, so it is shielded from the cancellation and stops itself once it sees cancel_event
+                future = loop.run_in_executor(self.executor, run)
+                future.add_done_callback(self.release)
+                future = asyncio.shield(future)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return await future
+
+    def release(self, future):
+        """Gives back the room a conversion took under max_concurrency, once the executor is done with it"""
+        self.semaphore.release()
+        if not future.cancelled():
+            future.exception()  # retrieved, so an abandoned conversion that failed is not logged as never retrieved
+
+    def forget(self, key: tuple, conversion: Dict, task):
+        if self.in_flight.get(key) is conversion:
+            del self.in_flight[key]
+
+
+default_converter = AsyncConverter()
+
+
+async def convert_async(*args, converter: AsyncConverter=None, **kwargs):
+    """
+    convert_async is the asyncio version of main.main, for use inside async services.
+
+    Arguments:
+    args, kwargs: see AsyncConverter.convert, which takes the same arguments as main.main except out and stats
+    converter: the AsyncConverter to run the conversion with, which sets the executor and the concurrency
+        limit (default: a shared one using the event loop's default thread pool, without a limit of its own)
+
+    Returns:
+    what main.main returns
+    """
+    return await (converter or default_converter).convert(*args, **kwargs)
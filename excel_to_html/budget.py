@@ -0,0 +1,119 @@
+try:
+    import static_values
+except ModuleNotFoundError:
+    from . import static_values
+import threading
+import tracemalloc
+from typing import Dict, Iterable
+
+
+tracing_lock = threading.Lock()
+tracing = {'trackers': 0, 'owned': False}  # the conversions tracing at once, and whether they started tracemalloc, see start_tracking
+
+
+def start_tracking():
+    """
+    tracemalloc is process-wide, so the conversions tracing their allocations at the same time share it. The first one
+    starts it (unless something else already had) and resets its peak, and the last one to finish stops it again.
+
+    Returns:
+    whether tracemalloc's peak was reset for this conversion, which is only the case when no other conversion is tracing
+    """
+    with tracing_lock:
+        reset = tracing['trackers'] == 0
+        if reset and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            tracing['owned'] = True
+        tracing['trackers'] += 1
+        reset = reset and hasattr(tracemalloc, 'reset_peak')  # new in Python 3.9
+        if reset:
+            tracemalloc.reset_peak()
+        return reset
+
+
+def stop_tracking():
+    with tracing_lock:
+        tracing['trackers'] -= 1
+        if tracing['trackers'] == 0 and tracing['owned']:
+            tracemalloc.stop()
+            tracing['owned'] = False
+
+
+class BudgetExceeded(Exception):
+    """Raised when a conversion goes over the limits of its Budget"""
+
+
+class Budget:
+    """
+    Limits how big a conversion can get, so that one oversized workbook fails fast with a BudgetExceeded instead
+    of taking down a shared worker. Pass one as budget to main, iter_html or convert_many.
+
+    The size of the view window is checked before any cell is parsed: its number of cells against max_cells, and an
+    estimate of the memory it needs (from its cells and merges, see estimate_memory) against max_memory. The
+    allocations are then traced with tracemalloc while the cells are parsed and rendered, and the conversion is stopped
+    as soon as they go over max_memory. Tracing makes the conversion noticeably slower.
+
+    After each conversion, peak_memory holds the most memory it had allocated at once, in bytes. tracemalloc traces the
+    whole process, so allocations made by other threads at the same time (such as other conversions) count too. While
+    other conversions are traced, tracemalloc's peak cannot be reset, and the peak is only sampled between chunks.
+    """
+
+    def __init__(self, max_cells: int=None, max_memory: int=None):
+        """
+        Arguments:
+        max_cells: the most cells a view window can have
+        max_memory: the most memory a conversion can allocate while parsing and rendering, in bytes
+        """
+        self.max_cells = max_cells
+        self.max_memory = max_memory
+        self.peak_memory = None  # of the last conversion, in bytes
+
+    @staticmethod
+    def estimate_memory(cells: int, merges: int):
+        """A rough estimate of the memory a conversion of a window of this size needs, in bytes"""
+        return cells * static_values.BUDGET_BYTES_PER_CELL + merges * static_values.BUDGET_BYTES_PER_MERGE
+
+    def check_sheet(self, ws, ws_meta: Dict):
+        """
+        Checks the size of the view window against the budget, raising a BudgetExceeded when it is too big.
+
+        Arguments:
+        ws: an openpyxl worksheet
+        ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+        """
+        rows = max(ws_meta['max_row'] + 1 - ws_meta['min_row'], 0)
+        cols = max(ws_meta['max_col'] + 1 - ws_meta['min_col'], 0)
+        cells = rows * cols
+        window = f"{ws.title!r} ({rows} rows by {cols} columns)"
+        if self.max_cells is not None and cells > self.max_cells:
+            raise BudgetExceeded(f"{window} has {cells} cells, more than max_cells={self.max_cells}")
+        if self.max_memory is not None:
+            estimate = self.estimate_memory(cells, len(ws_meta['merged_cell_ranges']))
+            if estimate > self.max_memory:
+                raise BudgetExceeded(f"{window} would need about {estimate} bytes, more than max_memory={self.max_memory}")
+
+    def iter_tracked(self, chunks: Iterable[str], stats=None):
+        """
+        Passes the chunks of a conversion through while tracing its allocations, stopping it with a BudgetExceeded
+        as soon as they go over max_memory. Records peak_memory once the chunks run out (or the conversion stops).
+
+        Arguments:
+        chunks: the generator of HTML strings of a conversion, which parses and renders the rows as it goes
+        stats: an optional stats.ConversionStats, whose peak_memory counter is kept at the highest peak seen
+        """
+        reset = start_tracking()
+        baseline = tracemalloc.get_traced_memory()[0]
+        sampled_peak = baseline
+        try:
+            for chunk in chunks:
+                current = tracemalloc.get_traced_memory()[0]
+                sampled_peak = max(sampled_peak, current)
+                if self.max_memory is not None and current - baseline > self.max_memory:
+                    raise BudgetExceeded(f"the conversion allocated {current - baseline} bytes, more than max_memory={self.max_memory}")
+                yield chunk
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_memory = (peak if reset else max(sampled_peak, current)) - baseline
+            stop_tracking()
+            if stats is not None:
+                stats.counts['peak_memory'] = max(stats.counts['peak_memory'], self.peak_memory)
@@ -0,0 +1,130 @@
+try:
+    import static_values
+except ModuleNotFoundError:
+    from . import static_values
+import json
+import time
+from typing import Dict
+
+
+def content_hash(pathname: str):
+    """The sha256 of a file's contents, so a cached conversion is found again however the file was copied or renamed"""
+    import hashlib  # hashlib and sqlite3 are imported on first use, see main.import_dependencies
+    digest = hashlib.sha256()
+    with open(pathname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file_hash: str, sheetname: str, bounds: tuple, openpyxl_kwargs: Dict, style_mode: str, options: Dict=None, engine: str='openpyxl'):
+    """
+    Builds the key of a conversion. Everything that can change the output is part of it, including the
+    version of this package, so upgrading never serves HTML rendered by an older version.
+
+    Arguments:
+    file_hash: the workbook's content_hash
+    sheetname, style_mode: see main.main
+    bounds: a tuple of (min_row, max_row, min_col, max_col)
+    openpyxl_kwargs: see main.main, including read_only, since a read-only sheet is read differently
+    options: the other arguments of main.main that change the output (trim, collapse_blank_rows, format_values), the ones left
+        at their defaults are left out so that adding an option does not change the other keys
+    engine: see main.main, left out when it is the default like the options
+
+    Returns:
+    a string
+    """
+    key = [static_values.VERSION, file_hash, sheetname, list(bounds), openpyxl_kwargs or {}, style_mode]
+    options = {k: v for k, v in (options or {}).items() if v}
+    if engine != 'openpyxl':
+        options['engine'] = engine
+    if options:
+        key.append(options)
+    return json.dumps(key, sort_keys=True, default=repr)
+
+
+class HTMLCache:
+    """
+    A persistent cache of converted tables, kept in a sqlite database so that several processes can share it.
+    Once the stored HTML grows past max_bytes, the least recently used entries are evicted.
+    Pass one as cache to main.main or main.convert_many.
+    """
+
+    def __init__(self, path: str, max_bytes: int=static_values.CACHE_MAX_BYTES, timeout: float=30):
+        """
+        Arguments:
+        path: the sqlite database, created if it does not exist
+        max_bytes: the size the stored HTML (and CSS) is kept under, utf-8 encoded
+        timeout: how long to wait for another process to release the database, in seconds
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        conn = self.connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')  # readers do not block the writer
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    html TEXT NOT NULL,
+                    css TEXT,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        finally:
+            conn.close()
+
+    def connect(self):
+        # a connection per operation, since connections cannot be shared with forked processes
+        import sqlite3
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def get(self, key: str):
+        """
+        Returns:
+        a tuple of the stored (html, css), or None if the key is not cached
+        """
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT html, css FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            return row
+        finally:
+            conn.close()
+
+    def put(self, key: str, html: str, css: str=None):
+        """Stores a conversion, then evicts the least recently used entries until the cache fits in max_bytes"""
+        size = len(html.encode('utf-8')) + len((css or '').encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, html, css, size, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, html, css, size, time.time()),
+            )
+            conn.execute('''
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running_size FROM entries
+                    ) WHERE running_size > ?
+                )
+            ''', (self.max_bytes,))
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM entries')
+        finally:
+            conn.close()
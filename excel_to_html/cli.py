@@ -0,0 +1,310 @@
+try:
+    import static_values
+    from budget import Budget
+    from cache import HTMLCache
+    from main import convert_many, warmup
+except ModuleNotFoundError:
+    from . import static_values
+    from .budget import Budget
+    from .cache import HTMLCache
+    from .main import convert_many, warmup
+import argparse
+import concurrent.futures
+import glob
+import os
+import re
+import sys
+import time
+from typing import Dict, List
+
+
+def expand_paths(patterns: List[str]):
+    """
+    Expands the files and glob patterns given on the command line.
+
+    Arguments:
+    patterns: a list of file paths and/or glob patterns (** is recursive)
+
+    Returns:
+    a sorted list of unique paths, and a list of the patterns that matched nothing
+    """
+    paths = set()
+    unmatched = []
+    for pattern in patterns:
+        matches = [match for match in glob.glob(pattern, recursive=True) if os.path.isfile(match)]
+        if not matches:
+            unmatched.append(pattern)
+        paths.update(os.path.normpath(match) for match in matches)
+    return sorted(paths), unmatched
+
+
+def safe_name(name: str):
+    """Replaces the characters that are awkward in file names with underscores"""
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def output_stems(paths: List[str]):
+    """
+    Picks the output file name (without extension) of each workbook. This is the workbook's name without
+    its extension, unless several workbooks share a name, in which case their whole paths are used instead.
+    Should two stems still be the same (a_x.xlsx next to a/x.xlsx), the later one gets a number, like a_x_2.
+
+    Arguments:
+    paths: the workbooks to convert
+
+    Returns:
+    a dictionary of path -> stem
+    """
+    stems = {path: os.path.splitext(os.path.basename(path))[0] for path in paths}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    for path, stem in stems.items():
+        if counts[stem] > 1:
+            stems[path] = safe_name(os.path.splitext(path)[0].lstrip(os.sep + '.'))
+    taken = set()
+    for path, stem in stems.items():
+        if stem in taken:
+            n = 2
+            while f'{stem}_{n}' in taken or f'{stem}_{n}' in stems.values():
+                n += 1
+            stem = stems[path] = f'{stem}_{n}'
+        taken.add(stem)
+    return stems
+
+
+def output_path(out_dir: str, stem: str, sheetname: str=None, extension: str='html'):
+    """
+    Builds the path of an output file: <out_dir>/<stem>.<extension>, or <out_dir>/<stem>.<sheetname>.<extension>
+    when a workbook's sheets are written to separate files.
+    """
+    if sheetname is not None:
+        stem = f'{stem}.{safe_name(sheetname)}'
+    return os.path.join(out_dir, f'{stem}.{extension}')
+
+
+def plan_tasks(paths: List[str], sheets: List[str], all_sheets: bool, split_sheets: bool):
+    """
+    Splits the work into tasks for the process pool. By default there is one task per workbook, so each
+    workbook is only loaded once; with split_sheets every sheet becomes its own task.
+
+    Arguments:
+    paths: the workbooks to convert
+    sheets: the sheets to convert in each workbook
+    all_sheets: convert every sheet of each workbook instead of sheets
+    split_sheets: make a task per sheet instead of per workbook
+
+    Returns:
+    a list of tasks, each a tuple of (pathname, output stem, sheetnames or None for all sheets, whether to name the outputs by sheet)
+    """
+    stems = output_stems(paths)
+    name_by_sheet = all_sheets or len(sheets) > 1
+    tasks = []
+    for pathname in paths:
+        task_sheets = None if all_sheets else sheets
+        if split_sheets and all_sheets:
+            try:
+                task_sheets = list_sheets(pathname)
+            except Exception:  # the worker will report it like any other broken workbook
+                pass
+        if split_sheets and task_sheets is not None:
+            tasks.extend((pathname, stems[pathname], [sheetname], name_by_sheet) for sheetname in task_sheets)
+        else:
+            tasks.append((pathname, stems[pathname], task_sheets, name_by_sheet))
+    return tasks
+
+
+def list_sheets(pathname: str):
+    import openpyxl  # only imported when needed, see main.import_dependencies
+    wb = openpyxl.load_workbook(pathname, read_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+def convert_task(task, out_dir: str, main_kwargs: Dict):
+    """
+    Converts one task from plan_tasks, writing the HTML into out_dir. This runs in the worker processes,
+    so errors are returned rather than raised, which keeps one broken workbook from failing the others.
+
+    Arguments:
+    task: a task from plan_tasks
+    out_dir: the directory to write the HTML into
+    main_kwargs: the keyword arguments for main (min_row, max_row, min_col, max_col, openpyxl_kwargs, style_mode, engine,
+        trim, collapse_blank_rows, format_values), with the path of the cache database (or None) as cache and the (max_cells, max_memory)
+        of the budget (or None) as budget
+
+    Returns:
+    a tuple of the task, the list of written files, the error message (None on success) and the time taken in seconds
+    """
+    start = time.perf_counter()
+    pathname, stem, sheetnames, name_by_sheet = task
+    written = []
+    try:
+        bounds = tuple(main_kwargs[k] for k in ('min_row', 'max_row', 'min_col', 'max_col'))
+        if sheetnames is None:
+            sheetnames = list_sheets(pathname)
+        results = convert_many(
+            pathname,
+            [(sheetname,) + bounds for sheetname in sheetnames],
+            openpyxl_kwargs=main_kwargs['openpyxl_kwargs'],
+            style_mode=main_kwargs['style_mode'],
+            cache=None if main_kwargs['cache'] is None else HTMLCache(main_kwargs['cache']),
+            engine=main_kwargs['engine'],
+            trim=main_kwargs['trim'],
+            collapse_blank_rows=main_kwargs['collapse_blank_rows'],
+            format_values=main_kwargs['format_values'],
+            budget=None if main_kwargs['budget'] is None else Budget(*main_kwargs['budget']),
+        )
+        for (sheetname, *_), result in results.items():
+            sheet_part = sheetname if name_by_sheet else None
+            if main_kwargs['style_mode'] == 'separate':
+                result, css = result
+                written.append(output_path(out_dir, stem, sheet_part, 'css'))
+                with open(written[-1], 'w', encoding='utf-8') as f:
+                    f.write(css)
+            written.append(output_path(out_dir, stem, sheet_part))
+            with open(written[-1], 'w', encoding='utf-8') as f:
+                f.write(result)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return task, written, error, time.perf_counter() - start
+
+
+def task_result(future: concurrent.futures.Future, task):
+    """
+    The result of a convert_task run on the process pool. If its worker died (which breaks the pool, failing
+    every task that had not finished yet), the task is reported as failed like any other error.
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        return task, [], f'{type(e).__name__}: {e}', 0.0
+
+
+def convert(args):
+    """
+    Runs the convert subcommand: converts every workbook matched by args.paths, spreading the tasks
+    over a pool of args.jobs processes, and reports the progress on stderr.
+
+    Returns:
+    the exit code, 0 if every workbook was converted and 1 otherwise
+    """
+    start = time.perf_counter()
+    paths, unmatched = expand_paths(args.paths)
+    for pattern in unmatched:
+        print(f'No files match {pattern}', file=sys.stderr)
+    tasks = plan_tasks(paths, args.sheet or ['Sheet1'], args.all_sheets, args.split_sheets)
+    os.makedirs(args.out_dir, exist_ok=True)
+    main_kwargs = {
+        'min_row': args.min_row,
+        'max_row': args.max_row,
+        'min_col': args.min_col,
+        'max_col': args.max_col,
+        'openpyxl_kwargs': {'read_only': args.read_only, 'data_only': args.data_only},
+        'style_mode': args.style_mode,
+        'cache': args.cache,
+        'engine': args.engine,
+        'trim': args.trim,
+        'collapse_blank_rows': args.collapse_blank_rows,
+        'format_values': args.format_values,
+        'budget': None if args.max_cells is None and args.max_memory is None else (args.max_cells, args.max_memory),
+    }
+
+    pool = None
+    if args.jobs > 1 and len(tasks) > 1:
+        warmup()  # so forked workers start with everything imported and compiled
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs)
+        futures = {pool.submit(convert_task, task, args.out_dir, main_kwargs): task for task in tasks}
+        results = (task_result(future, futures[future]) for future in concurrent.futures.as_completed(futures))
+    else:
+        results = (convert_task(task, args.out_dir, main_kwargs) for task in tasks)
+
+    failed = 0
+    try:
+        for i, (task, written, error, elapsed) in enumerate(results, 1):
+            label = task[0] if not args.split_sheets or task[2] is None else f'{task[0]} [{task[2][0]}]'
+            if error is None:
+                print(f'[{i}/{len(tasks)}] {label} -> {", ".join(written)} ({elapsed:.2f}s)', file=sys.stderr)
+            else:
+                failed += 1
+                print(f'[{i}/{len(tasks)}] FAILED {label}: {error}', file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    summary = f'Converted {len(tasks) - failed} of {len(tasks)} task(s) in {time.perf_counter() - start:.2f}s'
+    if failed:
+        summary += f', {failed} failed'
+    print(summary, file=sys.stderr)
+    return 1 if failed or unmatched else 0
+
+
+def serve(args):
+    """
+    Runs the serve subcommand: a conversion server with a pool of warm workers, see server.serve.
+
+    Returns:
+    the exit code, once the server is interrupted
+    """
+    try:  # only imported when needed, see main.import_dependencies
+        import server
+    except ModuleNotFoundError:
+        from . import server
+    server.serve(args.host, args.port, args.unix_socket, args.jobs, args.cache_size, args.max_upload)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='excel-to-html', description='Converts excel sheets to HTML tables.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    convert_parser = subparsers.add_parser('convert', help='convert workbooks to HTML files')
+    convert_parser.add_argument('paths', nargs='+', help='workbooks or glob patterns (** is recursive)')
+    convert_parser.add_argument('--out-dir', '-o', default='.', help='the directory to write the HTML into (default: the current directory)')
+    convert_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='the number of worker processes (default: one per core)')
+    convert_parser.add_argument('--sheet', '-s', action='append', help='a sheet to convert, can be repeated (default: Sheet1)')
+    convert_parser.add_argument('--all-sheets', action='store_true', help='convert every sheet of each workbook')
+    convert_parser.add_argument('--split-sheets', action='store_true', help='give every sheet its own task instead of every workbook')
+    convert_parser.add_argument('--min-row', type=int, help='see main')
+    convert_parser.add_argument('--max-row', type=int, help='see main')
+    convert_parser.add_argument('--min-col', type=int, help='see main')
+    convert_parser.add_argument('--max-col', type=int, help='see main')
+    convert_parser.add_argument('--style-mode', choices=static_values.STYLE_MODES, default='inline', help="see main, with 'separate' the CSS goes into a .css file next to the HTML")
+    convert_parser.add_argument('--read-only', action='store_true', help='stream the workbooks through openpyxl read_only mode')
+    convert_parser.add_argument('--data-only', action='store_true', help='use the cached values of formulas')
+    convert_parser.add_argument('--engine', choices=static_values.ENGINES, default='openpyxl', help="see main, 'xml' is faster on large sheets")
+    convert_parser.add_argument('--trim', action='store_true', help='leave out the trailing rows and columns without a value, border or fill, see main')
+    convert_parser.add_argument('--collapse-blank-rows', type=int, metavar='N', help='render runs of at least N identical blank rows as a single row, see main')
+    convert_parser.add_argument('--format-values', action='store_true', help="show the values under their number format, like '1,234.50' or '12%%', see main")
+    convert_parser.add_argument('--max-cells', type=int, help='fail the sheets with more cells than this, see Budget')
+    convert_parser.add_argument('--max-memory', type=int, metavar='BYTES', help='fail the conversions that need more memory than this, see Budget')
+    convert_parser.add_argument('--cache', help='a cache database, shared by the workers, see HTMLCache')
+    convert_parser.set_defaults(func=convert)
+
+    serve_parser = subparsers.add_parser('serve', help='run a local conversion server with warm workers')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='the address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', '-p', type=int, default=static_values.SERVER_PORT, help=f'the port to listen on (default: {static_values.SERVER_PORT})')
+    serve_parser.add_argument('--unix-socket', metavar='PATH', help='listen on a Unix socket instead of a port')
+    serve_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='the number of worker processes (default: one per core)')
+    serve_parser.add_argument('--cache-size', type=int, default=static_values.SERVER_WORKBOOK_CACHE_SIZE, help=f'the workbooks each worker keeps loaded (default: {static_values.SERVER_WORKBOOK_CACHE_SIZE})')
+    serve_parser.add_argument('--max-upload', type=int, metavar='BYTES', default=static_values.SERVER_MAX_UPLOAD_BYTES, help=f'the largest workbook that can be uploaded (default: {static_values.SERVER_MAX_UPLOAD_BYTES})')
+    serve_parser.set_defaults(func=serve)
+    return parser
+
+
+def cli(argv: List[str]=None):
+    """
+    The excel-to-html console entry point.
+
+    Arguments:
+    argv: the command line arguments, without the program name (default: sys.argv[1:])
+
+    Returns:
+    the exit code
+    """
+    args = build_parser().parse_args(argv)
+    return args.func(args)
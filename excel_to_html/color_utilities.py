@@ -1,3 +1,9 @@
+try:
+    import static_values
+except ModuleNotFoundError:
+    from . import static_values
+import functools
+from typing import Tuple
 # from https://stackoverflow.com/questions/58429823/getting-excel-cell-background-themed-color-as-hex-with-openpyxl
 from colorsys import rgb_to_hls, hls_to_rgb
 # https://bitbucket.org/openpyxl/openpyxl/issues/987/add-utility-functions-for-colors-to-help
@@ -56,7 +62,7 @@ def get_theme_colors(wb):
         else:
             colors.append(accent.getchildren()[0].attrib['val'])
 
-    return colors
+    return tuple(colors)  # a tuple, so it can be part of resolve_color's cache key
 
 
 def tint_luminance(tint, lum):
@@ -68,6 +74,46 @@ def tint_luminance(tint, lum):
         return int(round(lum * (1.0 - tint) + (HLSMAX - HLSMAX * (1.0 - tint))))
 
 
+conversion_count = 0  # read by stats.ConversionStats
+
+
 def rgb_and_tint_to_hex(rgb, tint):
+    global conversion_count
+    conversion_count += 1
     h, l, s = rgb_to_ms_hls(rgb)
     return rgb_to_hex(ms_hls_to_rgb(h, tint_luminance(tint, l), s))
+
+
+@functools.lru_cache(maxsize=static_values.COLOR_CACHE_SIZE)
+def resolve_color(color_type: str, value, tint: float, themes: Tuple[str], alpha: bool=False):
+    """
+    Converts an excel color to a hex-color. The same few colors show up over and over, so the results are cached,
+    see resolve_color.cache_info() for the hits and misses.
+
+    Arguments:
+    color_type, value, tint: the type, value and tint of an openpyxl color
+    themes: a tuple of hex-colors defined in the workbook
+    alpha: a boolean to determine whether or not to include the alpha channel
+
+    Returns:
+    a hex-color such as '#FF0000', or None if the color has no hex equivalent
+    """
+    if color_type == 'indexed':
+        if value in (64, 65):  # see COLOR_INDEX comment about 64/65
+            return None
+        return (static_values.INDEXED_COLORS_ALPHA if alpha else static_values.INDEXED_COLORS)[value]
+    elif color_type == 'rgb':
+        color = '00' + rgb_and_tint_to_hex(value, tint)
+    elif color_type == 'theme':
+        if value < len(themes):
+            color = '00' + rgb_and_tint_to_hex(themes[value], tint)
+        else:
+            color = '00000000'
+    elif color_type == 'auto':
+        color = '00000000'
+    else:
+        return None
+
+    if not alpha:
+        color = color[2:]
+    return '#' + color
@@ -0,0 +1,161 @@
+from .main import (
+    ParsedCell, ParsedRow, load_workbook, load_sheet, iter_sheet_cells, border_masks, resolve_borders,
+    apply_border_masks, get_table_template, iter_table_html
+)
+from typing import Dict, List
+
+
+def table_parts():
+    """
+    Splits the table template around its rows.
+
+    Returns:
+    the HTML before the first row and the HTML after the last row
+    """
+    empty = get_table_template().render(sheet_cells=[], style_attribute=None, none=None)
+    split = empty.index('</table>')
+    return empty[:split], empty[split:]
+
+
+def render_row(row: ParsedRow, parts=None):
+    """
+    Renders the HTML of a single row, exactly as it appears in the whole table.
+
+    Arguments:
+    row: A ParsedRow, with the borders of its cells fixed
+    parts: table_parts(), to avoid computing it for every row
+    """
+    prefix, suffix = parts or table_parts()
+    html = ''.join(iter_table_html([row]))
+    return html[len(prefix):len(html) - len(suffix)]
+
+
+def style_fingerprint(wb, style_id: int, style_fingerprints: Dict):
+    """
+    The font, fill, border and alignment behind a style id. Style ids are indexes into the workbook's style table,
+    which changes whenever a style is added, so they cannot be compared between two versions of a workbook.
+
+    Arguments:
+    wb: an openpyxl workbook
+    style_id: the style id of a cell
+    style_fingerprints: a dictionary of the fingerprints found so far (style id -> fingerprint)
+    """
+    fingerprint = style_fingerprints.get(style_id)
+    if fingerprint is None:
+        style = wb._cell_styles[style_id]
+        fingerprint = style_fingerprints[style_id] = hash((
+            wb._fonts[style.fontId],
+            wb._fills[style.fillId],
+            wb._borders[style.borderId],
+            wb._alignments[style.alignmentId],
+        ))
+    return fingerprint
+
+
+def row_fingerprint(wb, row, style_fingerprints: Dict):
+    """Everything about a row of raw cells (from iter_sheet_cells) that its HTML depends on, besides the sheet_fingerprint"""
+    return hash(tuple(
+        None if cell is None else (
+            cell.row,
+            cell.column,
+            cell.value,
+            style_fingerprint(wb, cell.style_id, style_fingerprints),
+            ParsedCell.handle_hyperlink(cell),
+        )
+        for cell in row
+    ))
+
+
+def sheet_fingerprint(ws, ws_meta: Dict):
+    """
+    Everything that the HTML of every row depends on: the sheet, the view window, its sizes and merged cells and the theme.
+    """
+    layout = (
+        ws.title,
+        tuple(sorted(ws_meta['column_widths'].items())),
+        ws_meta['default_col_width'],
+        tuple(sorted(ws_meta['row_heights'].items())),
+        ws_meta['default_row_height'],
+        tuple(sorted(str(merge_range) for merge_range in ws_meta['merged_cell_ranges'])),
+        tuple(ws_meta[k] for k in ('min_row', 'max_row', 'min_col', 'max_col')),
+    )
+    return hash((layout, ws_meta['themes']))
+
+
+class IncrementalRenderer:
+    """
+    Renders the same sheet over and over, as it changes, only parsing and rendering the rows that changed.
+    It keeps a fingerprint (values, styles and hyperlinks) and the HTML of every row from the previous render.
+    A row is rendered again when its fingerprint changed, or when a row next to it changed, since that can change
+    which of its borders are drawn. Anything that affects every row (the sizes, merged cells or theme) makes it
+    render everything again. The result is always the same as main.main with style_mode='inline'.
+
+    The workbook itself still has to be loaded to compare the rows, so the time saved is the parsing and rendering.
+    """
+
+    def __init__(self):
+        self.sheet_fingerprint = None
+        self.row_fingerprints = []
+        self.row_html = []
+        self.rendered_rows = 0  # how many rows the last render had to parse and render
+
+    def render(
+        self,
+        pathname: str,
+        sheetname: str='Sheet1',
+        min_row: int=None,
+        max_row: int=None,
+        min_col: int=None,
+        max_col: int=None,
+        openpyxl_kwargs: Dict=None
+    ):
+        """
+        Arguments:
+        pathname, sheetname, min_row, max_row, min_col, max_col, openpyxl_kwargs: see main.main
+
+        Returns:
+        a string containing the formatted HTML table, the same as main.main returns
+        """
+        wb, wb_meta = load_workbook(pathname, openpyxl_kwargs)
+        try:
+            ws, ws_meta = load_sheet(wb, wb_meta, sheetname, min_row, max_row, min_col, max_col)
+            fingerprint = sheet_fingerprint(ws, ws_meta)
+            sheet_rows = list(iter_sheet_cells(ws, ws_meta, min_row, max_row, min_col, max_col))
+            style_fingerprints = {}
+            row_fingerprints = [row_fingerprint(wb, row, style_fingerprints) for row in sheet_rows]
+
+            if fingerprint != self.sheet_fingerprint:
+                changed = set(range(len(sheet_rows)))
+            else:
+                changed = {
+                    i for i, new in enumerate(row_fingerprints)
+                    if i >= len(self.row_fingerprints) or self.row_fingerprints[i] != new
+                }
+            dirty = {j for i in changed for j in (i - 1, i, i + 1) if 0 <= j < len(sheet_rows)}
+            needed = {j for i in dirty for j in (i - 1, i, i + 1) if 0 <= j < len(sheet_rows)}  # for their borders
+            parsed_rows = {
+                i: ParsedRow((ParsedCell(cell, ws_meta, i, j) for j, cell in enumerate(sheet_rows[i]) if cell is not None), ws_meta, i)
+                for i in needed
+            }
+        finally:
+            if wb_meta['read_only']:
+                wb.close()
+
+        parts = table_parts()
+        row_html = self.row_html[:len(sheet_rows)] + [None] * (len(sheet_rows) - len(self.row_html))
+        for i in dirty:
+            masks = border_masks(parsed_rows[i])
+            if i - 1 in parsed_rows:
+                resolve_borders(masks, border_masks(parsed_rows[i - 1]))
+            else:
+                resolve_borders(masks, [])
+            if i + 1 in parsed_rows:
+                resolve_borders(border_masks(parsed_rows[i + 1]), masks)
+            apply_border_masks(parsed_rows[i], masks)
+            row_html[i] = render_row(parsed_rows[i], parts)
+
+        self.sheet_fingerprint = fingerprint
+        self.row_fingerprints = row_fingerprints
+        self.row_html = row_html
+        self.rendered_rows = len(dirty)
+        return parts[0] + ''.join(row_html) + parts[1]
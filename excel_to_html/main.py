@@ -1,52 +1,131 @@
+from __future__ import annotations  # the openpyxl annotations are never evaluated, see import_dependencies
 try:
     import color_utilities
+    import number_formats
     import static_values
+    from cache import cache_key, content_hash
+    from stats import timed
 except ModuleNotFoundError:
-    from . import color_utilities, static_values
-import openpyxl
+    from . import color_utilities, number_formats, static_values
+    from .cache import cache_key, content_hash
+    from .stats import timed
 import math
-import jinja2
-from typing import Dict, List
+import functools
+from typing import Dict, Iterable, List, Tuple
+
+
+def import_dependencies():
+    """
+    openpyxl, jinja2 and the read_only and xml_engine modules take far longer to import than the rest of the package,
+    so they are only imported once a workbook is converted. That keeps `import excel_to_html` cheap for short-lived processes.
+
+    Returns:
+    the openpyxl, jinja2, read_only and xml_engine modules
+    """
+    import openpyxl
+    import openpyxl.cell.cell
+    import openpyxl.utils.cell
+    import jinja2
+    if __package__:  # not `try: import read_only`, which would pick up any other module of that name first
+        from . import read_only, xml_engine
+    else:
+        import read_only
+        import xml_engine
+    return openpyxl, jinja2, read_only, xml_engine
+
+
+def warmup():
+    """
+    Does the work that is otherwise done by the first conversion in a process: importing openpyxl, jinja2 and
+    the read_only and xml_engine modules and compiling the table templates. Call it before forking a pool of workers, so they
+    start warm, or at startup to keep that cost out of the first request.
+    """
+    import_dependencies()
+    get_table_template()
+    get_table_template(compact=True)
 
 
 def handle_color(
     color: openpyxl.styles.colors.Color,
-    themes: List[str],
+    themes: Tuple[str],
     alpha: bool=False
 ):
     """
-    handle_color parses the various subtypes of excel colors into a hex-color
+    handle_color parses the various subtypes of excel colors into a hex-color, see color_utilities.resolve_color
 
     Arguments:
     color: an openpyxl color
-    themes: a list of hex-colors defined in the sheet
+    themes: a tuple of hex-colors defined in the sheet
     alpha: a boolean to determine whether or not to include the alpha channel
     """
     if color is None:
         return None
-    if color.type == 'indexed':
-        if color.indexed in (64, 65):  # see COLOR_INDEX comment about 64/65
-            return None
-        color = static_values.COLOR_INDEX[color.indexed]
-    elif color.type == 'rgb':
-        color = '00' + color_utilities.rgb_and_tint_to_hex(color.rgb, color.tint)
-    elif color.type == 'theme':
-        if color.theme < len(themes):
-            rgb = themes[color.theme]
-            color = '00' + color_utilities.rgb_and_tint_to_hex(rgb, color.tint)
+    if not isinstance(themes, tuple):
+        themes = tuple(themes)
+    return color_utilities.resolve_color(color.type, color.value, color.tint, themes, alpha)
+
+
+def css_declarations(style: Dict):
+    """
+    Joins a dictionary of styles into the body of a style attribute.
+    """
+    return '; '.join(f'{k}: {v}' for k, v in style.items())
+
+
+class CellStyle:
+    """
+    The styles of every cell sharing a style id, computed once by ParsedCell.handle_cell_style.
+    Cells point at these records rather than holding their own copies, and never modify them.
+    """
+    __slots__ = (
+        'font_style', 'border_style', 'default_border', 'alignment_style', 'formatter',
+        'default_sides', 'has_background', 'font_css', 'alignment_css', 'border_css',
+    )
+
+    def __init__(self, font_style: Dict, border_style: Dict, default_border: Dict, alignment_style: Dict, formatter=None):
+        self.font_style = font_style
+        self.border_style = border_style
+        self.default_border = default_border
+        self.alignment_style = alignment_style
+        self.formatter = formatter  # the cells' number format, compiled by number_formats.compile_format
+        self.default_sides = sum(static_values.SIDE_BITS[side] for side, is_default in default_border.items() if is_default)
+        self.has_background = font_style.get('background-color') is not None
+        self.font_css = css_declarations(font_style)
+        self.alignment_css = css_declarations(alignment_style)
+        self.border_css = {}  # deleted sides -> css, see get_border_css
+
+    def get_border_style(self, deleted_sides: int=0):
+        """
+        get_border_style leaves the deleted default borders (see iter_fixed_rows) out of the border styles. If the styles have a
+        "border" style, it is split into border-left, border-top, etc. so that the deleted sides can be left out.
+
+        Arguments:
+        deleted_sides: the bits (see static_values.SIDE_BITS) of the default borders that were removed
+
+        Returns:
+        a dictionary of border styles
+        """
+        if not deleted_sides:
+            return self.border_style
+        if 'border' in self.border_style:
+            ret = {f'border-{side}': static_values.DEFAULT_BORDER for side in static_values.BORDER_SIDES}
         else:
-            color = '00000000'
-    elif color.type == 'auto':
-        color = '00000000'
-    else:
-        return None
+            ret = dict(self.border_style)
+        for side in static_values.BORDER_SIDES:
+            if deleted_sides & static_values.SIDE_BITS[side]:
+                del ret[f'border-{side}']
+        return ret
 
-    if not alpha:
-        color = color[2:]
-    return '#' + color
+    def get_border_css(self, deleted_sides: int=0):
+        css = self.border_css.get(deleted_sides)
+        if css is None:
+            css = self.border_css[deleted_sides] = css_declarations(self.get_border_style(deleted_sides))
+        return css
 
 
 class ParsedCell:
+    __slots__ = ('text', 'hyperlink', 'style', 'deleted_sides', 'rowspan', 'colspan', 'row_idx', 'col_idx', 'pixel_width', 'pixel_height')
+
     def __init__(
         self,
         cell: openpyxl.styles.colors.Color,
@@ -54,14 +133,92 @@ class ParsedCell:
         row_idx: int,
         col_idx: int
     ):
-        self.text = cell.value or ''
+        self.style = self.handle_cell_style(cell, ws_meta)
+        self.text = self.handle_value(cell, self.style, ws_meta)
         self.hyperlink = self.handle_hyperlink(cell)
-        self.font_style = self.handle_font_style(cell, ws_meta['themes'])
-        self.border_style, self.default_border = self.handle_border_style(cell, ws_meta['themes'])
+        self.deleted_sides = 0  # default borders removed by iter_fixed_rows
         self.rowspan, self.colspan = self.handle_merged_cells(cell, ws_meta)
         self.row_idx = row_idx
         self.col_idx = col_idx
-        self.sizing_style = self.handle_sizing(cell, ws_meta, row_idx, col_idx, self.rowspan, self.colspan)
+        self.pixel_width, self.pixel_height = self.handle_sizing(ws_meta, row_idx, col_idx, self.rowspan, self.colspan)
+
+    @property
+    def font_style(self):
+        return self.style.font_style
+
+    @property
+    def border_style(self):
+        return self.style.get_border_style(self.deleted_sides)
+
+    @property
+    def default_border(self):
+        return {side: self.is_default_border(side) for side in static_values.BORDER_SIDES}
+
+    @property
+    def sizing_style(self):
+        return {'width': f'{self.pixel_width}px', 'height': f'{self.pixel_height}px', **self.style.alignment_style}
+
+    def is_default_border(self, side: str):
+        """
+        Returns whether the given side of the cell still has the default border.
+        """
+        bit = static_values.SIDE_BITS[side]
+        return bool(self.style.default_sides & bit) and not self.deleted_sides & bit
+
+    @classmethod
+    def handle_cell_style(
+        cls,
+        cell: openpyxl.styles.colors.Color,
+        ws_meta: Dict
+    ):
+        """
+        handle_cell_style looks up the font, border and alignment styles and the number format of a cell in the workbook's style table,
+        computing them the first time a style id is seen. Every cell sharing a style id shares the same entry.
+
+        Arguments:
+        cell: an openpyxl cell
+        ws_meta: A dictionary containing global values for the worksheet (themes, the style table)
+
+        Returns:
+        a CellStyle
+        """
+        style_table = ws_meta['style_table']
+        style = style_table.get(cell.style_id)
+        if style is None:
+            border_style, default_border = cls.handle_border_style(cell, ws_meta['themes'])
+            style = style_table[cell.style_id] = CellStyle(
+                cls.handle_font_style(cell, ws_meta['themes']),
+                border_style,
+                default_border,
+                cls.handle_alignment(cell),
+                number_formats.compile_format(cell.number_format),
+            )
+        return style
+
+    @staticmethod
+    def handle_value(
+        cell: openpyxl.styles.colors.Color,
+        style: CellStyle,
+        ws_meta: Dict
+    ):
+        """
+        handle_value renders the value of a cell. With ws_meta['format_values'] the value is shown the way excel displays it
+        under its number format, using the formatter shared by every cell of its style, otherwise it is shown as it is.
+
+        Arguments:
+        cell: an openpyxl cell
+        style: the cell's CellStyle, from handle_cell_style
+        ws_meta: A dictionary containing global values for the worksheet (format_values)
+
+        Returns:
+        a string, or the raw value without format_values
+        """
+        value = cell.value
+        if not ws_meta['format_values']:
+            return value or ''
+        if value is None:
+            return ''
+        return style.formatter(value)
 
     @staticmethod
     def handle_hyperlink(cell: openpyxl.styles.colors.Color):
@@ -81,7 +238,6 @@ class ParsedCell:
 
     @staticmethod
     def handle_sizing(
-        cell: openpyxl.styles.colors.Color,
         ws_meta: Dict,
         row_idx: int,
         col_idx: int,
@@ -92,25 +248,38 @@ class ParsedCell:
         handle_sizing uses the cell position and span to figure out the proper width and height of the cell.
 
         Arguments:
-        cell: an openpyxl cell
-        ws_meta: A dictionary containing global values for the worksheet (themes, a list of merged_cells)
-        row_idx: an integer representing the 0-based row of the cell
-        row_idx: an integer representing the 0-based column of the cell
+        ws_meta: A dictionary containing global values for the worksheet (the column_offsets and row_offsets of the view window)
+        row_idx: an integer representing the 0-based row of the cell, counted from the top of the view window
+        col_idx: an integer representing the 0-based column of the cell, counted from the left of the view window
         rowspan: an integer representing the rowspan of the cell
         colspan: an integer representing the colspan of the cell
 
         Returns:
-        a dictionary of alignment and sizing styles
+        a tuple of the (width, height) of the cell in pixels
+        """
+        column_offsets, row_offsets = ws_meta['column_offsets'], ws_meta['row_offsets']
+        if col_idx + colspan < len(column_offsets):
+            width = column_offsets[col_idx + colspan] - column_offsets[col_idx]
+        else:  # past the window that load_sheet expected, see span_size
+            width = span_size(ws_meta['column_widths'], ws_meta['default_col_width'], ws_meta['min_col'] - 1 + col_idx, colspan)
+        if row_idx + rowspan < len(row_offsets):
+            height = row_offsets[row_idx + rowspan] - row_offsets[row_idx]
+        else:
+            height = span_size(ws_meta['row_heights'], ws_meta['default_row_height'], ws_meta['min_row'] - 1 + row_idx, rowspan)
+        return width, height
+
+    @staticmethod
+    def handle_alignment(cell: openpyxl.styles.colors.Color):
+        """
+        handle_alignment parses the horizontal and vertical alignment of a cell.
+
+        Arguments:
+        cell: an openpyxl cell
+
+        Returns:
+        a dictionary of alignment styles
         """
         ret = {}
-        width = 0
-        for col in range(col_idx, col_idx + colspan):
-            width += ws_meta['column_widths'].get(col_idx, ws_meta['default_col_width'])
-        height = 0
-        for row in range(row_idx, row_idx + rowspan):
-            height += ws_meta['row_heights'].get(row_idx, ws_meta['default_row_height'])
-        ret['width'] = str(width) + 'px'
-        ret['height'] = str(height) + 'px'
         horizontal = cell.alignment.horizontal or 'left'
         vertical = cell.alignment.vertical or 'bottom'
         if vertical == 'center':
@@ -125,35 +294,28 @@ class ParsedCell:
         ws_meta: Dict
     ):
         """
-        handle_merged_cells uses the view window and the merged_cell_ranges to figure out the proper rowspan and colspan for a cell.
+        handle_merged_cells looks up the proper rowspan and colspan for a cell in the merge index of the worksheet.
 
         Arguments:
         cell: an openpyxl cell
-        ws_meta: A dictionary containing global values for the worksheet (themes, a list of merged_cells)
+        ws_meta: A dictionary containing global values for the worksheet (themes, the merge index)
 
         Returns:
         A tuple of two integers representing the (rowspan, colspan) of the cell
         """
-        def clamp_to_window(v, direction):
-            return max(ws_meta[f'min_{direction}'], min(v, ws_meta[f'max_{direction}']))
-        for merge_range in ws_meta['merged_cell_ranges']:
-            if cell.coordinate in merge_range:
-                rowspan = clamp_to_window(merge_range.max_row, 'row') - clamp_to_window(merge_range.min_row, 'row') + 1
-                colspan = clamp_to_window(merge_range.max_col, 'col') - clamp_to_window(merge_range.min_col, 'col') + 1
-                return rowspan, colspan
-        return 1, 1
+        return ws_meta['merge_spans'].get((cell.row, cell.column), (1, 1))
 
     @staticmethod
     def handle_border_style(
         cell: openpyxl.styles.colors.Color,
-        themes: List[str]
+        themes: Tuple[str]
     ):
         """
         handle_font_style parses all of the styles relating to borders.
 
         Arguments:
         cell: an openpyxl cell
-        themes: a list of hex-colors defined in the sheet
+        themes: a tuple of hex-colors defined in the sheet
 
         Returns:
         a dictionary of styles and a dicionary of which borders are default for that cell
@@ -190,14 +352,14 @@ class ParsedCell:
     @staticmethod
     def handle_font_style(
         cell: openpyxl.styles.colors.Color,
-        themes: List[str]
+        themes: Tuple[str]
     ):
         """
         handle_font_style parses all of the styles relating to font and background color.
 
         Arguments:
         cell: an openpyxl cell
-        themes: a list of hex-colors defined in the sheet
+        themes: a tuple of hex-colors defined in the sheet
 
         Returns:
         a dictionary of styles
@@ -223,116 +385,1011 @@ class ParsedCell:
         return ret
 
     def get_style(self):
-        style = []
-        for k, v in self.font_style.items():
-            style.append(f'{k}: {v}')
-        for k, v in self.border_style.items():
-            style.append(f'{k}: {v}')
-        for k, v in self.sizing_style.items():
-            style.append(f'{k}: {v}')
-        return '; '.join(style)
+        style = [
+            self.style.font_css,
+            self.style.get_border_css(self.deleted_sides),
+            f'width: {self.pixel_width}px; height: {self.pixel_height}px',
+            self.style.alignment_css,
+        ]
+        return '; '.join(part for part in style if part)
 
 
-def to_html(sheet_cells: List[List[ParsedCell]]):
+class ParsedRow(list):
     """
-    Converts the parsed_sheet to an HTML table.
+    A list of the ParsedCells of a row, with the row's own position and height. The height comes from the row sizes
+    rather than from a cell, since a row can have no cells of its own (all of them covered by merges from above).
+    """
+    __slots__ = ('row_idx', 'pixel_height')
+
+    def __init__(self, cells: Iterable[ParsedCell], ws_meta: Dict, row_idx: int):
+        super().__init__(cells)
+        self.row_idx = row_idx
+        row_offsets = ws_meta['row_offsets']
+        if row_idx + 1 < len(row_offsets):
+            self.pixel_height = row_offsets[row_idx + 1] - row_offsets[row_idx]
+        else:  # see ParsedCell.handle_sizing
+            self.pixel_height = span_size(ws_meta['row_heights'], ws_meta['default_row_height'], ws_meta['min_row'] - 1 + row_idx, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_table_template(compact: bool=False):
+    """
+    Compiles the HTML table template. This only happens once per process.
 
     Arguments:
-    sheet_cells: A list of lists of cells, with each inner list representing a row
+    compact: compile the template of style_mode='compact' instead, see compact_row
 
     Returns:
-    a string containing the formatted HTML table
+    a jinja2.Template, rendered with sheet_cells (an iterable of rows) and style_attribute (a function of a ParsedCell),
+    or for the compact template with column_widths (see get_column_widths) and rows (from iter_compact_rows)
     """
+    _, jinja2, _, _ = import_dependencies()
+    if compact:
+        return jinja2.Template('''
+            <table style="border-collapse:collapse">
+                {%- if column_widths -%}
+                    <colgroup>
+                        {%- for width in column_widths -%}
+                            <col style="width: {{width}}px">
+                        {%- endfor -%}
+                    </colgroup>
+                {%- endif -%}
+                {%- for row_attributes, cells in rows -%}
+                    <tr{{row_attributes}}>
+                        {%- for cell, cell_attributes in cells -%}
+                            {%- if cell.hyperlink is none -%}
+                                <td{{cell_attributes}}>{{cell.text}}</td>
+                            {%- else -%}
+                                <td{{cell_attributes}}><a href="{{cell.hyperlink}}">{{cell.text}}</a></td>
+                            {%- endif -%}
+                        {%- endfor -%}
+                    </tr>
+                {%- endfor -%}
+            </table>
+        ''')
     return jinja2.Template('''
         <table style="border-collapse:collapse">
             {%- for row in sheet_cells -%}
-                <tr style="height: {{row[0].height}}">
+                <tr style="height: {{row.pixel_height}}px">
                     {%- for cell in row -%}
                         {%- if cell.hyperlink is none -%}
-                            <td style="{{cell.get_style()}}" rowspan={{cell.rowspan}} colspan={{cell.colspan}}>{{cell.text}}</td>
+                            <td {{style_attribute(cell)}} rowspan={{cell.rowspan}} colspan={{cell.colspan}}>{{cell.text}}</td>
                         {%- else -%}
-                            <td style="{{cell.get_style()}}" rowspan={{cell.rowspan}} colspan={{cell.colspan}}><a href="{{cell.hyperlink}}">{{cell.text}}</a></td>
+                            <td {{style_attribute(cell)}} rowspan={{cell.rowspan}} colspan={{cell.colspan}}><a href="{{cell.hyperlink}}">{{cell.text}}</a></td>
                         {%- endif -%}
                     {%- endfor -%}
                 </tr>
             {%- endfor -%}
         </table>
-    ''').render(sheet_cells=sheet_cells, none=None)
+    ''')
 
 
-def delete_side(cell: ParsedCell, del_side: str):
+def iter_table_html(sheet_cells: Iterable[List[ParsedCell]], style_classes: Dict=None, column_widths: List[int]=None):
     """
-    Handles the deletion of a border of a cell. If the cell has a "border" style,
-    splits it into border-left, border-top, etc.
+    Converts the parsed_sheet to an HTML table, yielding the HTML piece by piece. Rows are only pulled
+    from sheet_cells as they are rendered, so sheet_cells can be a generator.
 
-    Argument:
-    cell: a ParsedCell
-    del_side: one of ['top', 'right', 'bottom', 'left']
+    Arguments:
+    sheet_cells: An iterable of lists of cells, with each inner list representing a row
+    style_classes: If given, each distinct cell style is interned into this dictionary (style -> class name)
+        and the cells reference their class instead of inlining the style
+    column_widths: If given, the table is rendered the way style_mode='compact' does (see compact_row), with these
+        widths (see get_column_widths) in its <colgroup>. style_classes is ignored then
 
     Returns:
-    None
+    a generator of strings that together form the HTML table
     """
-    if cell is None:  # probably a merged cell or the edge of the sheet
-        return
+    if column_widths is not None:
+        rows = iter_compact_rows(sheet_cells, column_widths)
+        return get_table_template(compact=True).generate(column_widths=column_widths, rows=rows, none=None)
 
-    if cell.default_border[del_side] is True:
-        if 'border' in cell.border_style:  # we need to convert border to individual border sides to delete one of them
-            del cell.border_style['border']
-            for side in static_values.BORDER_SIDES:
-                cell.border_style[f'border-{side}'] = static_values.DEFAULT_BORDER
+    def style_attribute(cell):
+        style = cell.get_style()
+        if style_classes is None:
+            return f'style="{style}"'
+        css_class = style_classes.get(style)
+        if css_class is None:
+            css_class = style_classes[style] = f'{static_values.CSS_CLASS_PREFIX}{len(style_classes)}'
+        return f'class="{css_class}"'
 
-        del cell.border_style[f'border-{del_side}']
-        cell.default_border[del_side] = False
+    return get_table_template().generate(sheet_cells=sheet_cells, style_attribute=style_attribute, none=None)
 
 
-def fix_borders(sheet_cells: List[List[ParsedCell]], ws_meta: Dict):
+def get_column_widths(ws_meta: Dict):
     """
-    Makes sure that explicitly set borders are not overwritten by default borders.
-    Does this by deleting the overlapping default border of any adjcent cell.
+    The pixel width of every column of the view window, which is the width of an unmerged cell in that column.
+
+    Arguments:
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+    """
+    offsets = ws_meta['column_offsets']
+    return [end - start for start, end in zip(offsets, offsets[1:])]
+
+
+def most_common(values: List[str]):
+    """
+    The value shared by the most of values (the first one on a tie), if at least two share it and none of them is None.
+    """
+    if None in values:
+        return None
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    value = max(counts, key=counts.get, default=None)
+    return value if counts.get(value, 0) > 1 else None
+
+
+def border_declarations(sides: Dict):
+    """
+    Writes the borders of a cell in as few declarations as possible. When all four sides have a border, the most
+    common one becomes a single border declaration, followed by the sides that differ from it.
+
+    Arguments:
+    sides: a dictionary of side -> border of the sides that have a border, in static_values.BORDER_SIDES order
+
+    Returns:
+    a dictionary of styles
+    """
+    if len(sides) == len(static_values.BORDER_SIDES):
+        common = most_common(list(sides.values()))
+        if common is not None:
+            ret = {'border': common}
+            ret.update((f'border-{side}', border) for side, border in sides.items() if border != common)
+            return ret
+    return {f'border-{side}': border for side, border in sides.items()}
+
+
+def compact_row(row: ParsedRow, column_widths: List[int]):
+    """
+    Works out the attributes of a row and its cells for style_mode='compact', which looks the same as 'inline'
+    in far fewer bytes:
+        the height of the row goes on its <tr> and the width of each column on its <col>, so only the merged
+            cells still need a width and height of their own
+        the inherited declarations (static_values.INHERITED_STYLES) that every cell of the row has go on the <tr>,
+            with the most common value, so only the cells with another value keep theirs
+        with collapsed borders, neighboring cells share the border between them, so the left border of a cell
+            is dropped when it repeats the right border of the cell before it
+        the borders are written with as few declarations as possible, see border_declarations
+        rowspan=1 and colspan=1 are left out
+
+    Arguments:
+    row: A ParsedRow, with the borders of its cells fixed
+    column_widths: see get_column_widths
+
+    Returns:
+    the attributes of the <tr> and a list of the attributes of each <td>, each either empty or starting with a space
+    """
+    row_style = {'height': f'{row.pixel_height}px'}
+    for key in static_values.INHERITED_STYLES:
+        value = most_common([cell.style.font_style.get(key, cell.style.alignment_style.get(key)) for cell in row])
+        if value is not None:
+            row_style[key] = value
+
+    cell_attributes = []
+    previous = previous_sides = None
+    for cell in row:
+        border_style = cell.style.get_border_style(cell.deleted_sides)
+        if 'border' in border_style:
+            sides = dict.fromkeys(static_values.BORDER_SIDES, border_style['border'])
+        else:
+            sides = {side: border_style[f'border-{side}'] for side in static_values.BORDER_SIDES if f'border-{side}' in border_style}
+        shared_border = (
+            previous is not None
+            and previous.col_idx + previous.colspan == cell.col_idx
+            and 'left' in sides
+            and sides['left'] == previous_sides.get('right')
+        )
+        if shared_border and not (len(sides) == len(static_values.BORDER_SIDES) and len(set(sides.values())) == 1):  # a lone border declaration is shorter still
+            sides = {side: border for side, border in sides.items() if side != 'left'}
+        previous, previous_sides = cell, sides
+
+        declarations = {k: v for k, v in cell.style.font_style.items() if row_style.get(k) != v}
+        declarations.update(border_declarations(sides))
+        if cell.colspan != 1 or cell.pixel_width != column_widths[cell.col_idx]:
+            declarations['width'] = f'{cell.pixel_width}px'
+        if cell.rowspan != 1 or f'{cell.pixel_height}px' != row_style['height']:
+            declarations['height'] = f'{cell.pixel_height}px'
+        declarations.update((k, v) for k, v in cell.style.alignment_style.items() if row_style.get(k) != v)
+
+        attributes = f' style="{css_declarations(declarations)}"' if declarations else ''
+        if cell.rowspan != 1:
+            attributes += f' rowspan={cell.rowspan}'
+        if cell.colspan != 1:
+            attributes += f' colspan={cell.colspan}'
+        cell_attributes.append(attributes)
+
+    row_attributes = f' style="{css_declarations(row_style)}"' if row_style else ''
+    return row_attributes, cell_attributes
+
+
+def iter_compact_rows(sheet_cells: Iterable[List[ParsedCell]], column_widths: List[int]):
+    """
+    Pairs the cells of every row with their attributes from compact_row, for the compact table template.
+
+    Returns:
+    a generator of tuples of (the <tr> attributes, a list of (cell, <td> attributes)), one per row
+    """
+    for row in sheet_cells:
+        row_attributes, cell_attributes = compact_row(row, column_widths)
+        yield row_attributes, list(zip(row, cell_attributes))
+
+
+def to_html(sheet_cells: List[List[ParsedCell]], style_classes: Dict=None):
+    """
+    Converts the parsed_sheet to an HTML table.
 
     Arguments:
     sheet_cells: A list of lists of cells, with each inner list representing a row
-    ws_meta: A dictionary containing global values for the worksheet (themes, a list of merged_cells)
+    style_classes: If given, each distinct cell style is interned into this dictionary (style -> class name)
+        and the cells reference their class instead of inlining the style
+
+    Returns:
+    a string containing the formatted HTML table
+    """
+    return ''.join(iter_table_html(sheet_cells, style_classes))
+
+
+def to_css(style_classes: Dict):
+    """
+    Converts the interned styles from to_html into a stylesheet.
+
+    Arguments:
+    style_classes: A dictionary of style -> class name, as filled by to_html
+
+    Returns:
+    a string containing one CSS rule per class
+    """
+    return '\n'.join(f'.{css_class} {{{style}}}' for style, css_class in style_classes.items())
+
+
+def border_masks(row: List[ParsedCell]):
+    """
+    Lays a row out as a dense list of border masks, one per column, for resolve_borders. A bit of a mask
+    (see static_values.SIDE_BITS) is set while that side of the cell still has the default border. A cell
+    with a background color starts with none, since in excel a colored background hides the default border.
+    The columns without a cell (hidden by a merge) get every bit, so they never affect their neighbors.
+
+    Arguments:
+    row: A list of cells
+
+    Returns:
+    a list of ints, indexed by col_idx
+    """
+    masks = [static_values.ALL_SIDES] * (row[-1].col_idx + 1 if row else 0)
+    for cell in row:
+        masks[cell.col_idx] = 0 if cell.style.has_background else cell.style.default_sides
+    return masks
+
+
+def resolve_borders(masks: List[int], previous_masks: List[int]):
+    """
+    Makes sure that explicitly set borders are not overwritten by default borders. Every edge
+    is shared by two cells, and if either of them does not draw the default border there, neither does the other.
+    This resolves the edges between the cells of a row and the edges it shares with the row above, in place.
+
+    Arguments:
+    masks: the border masks of a row, from border_masks
+    previous_masks: the border masks of the row above (empty for the first row)
 
     Returns:
     None
     """
-    cell_dict = {}
-    for row in sheet_cells:
-        for cell in row:
-            cell_dict[(cell.row_idx, cell.col_idx)] = cell
-    for row in sheet_cells:
-        for cell in row:
-            for side, is_default in cell.default_border.items():
-                if is_default is False:
-                    if side == 'top':
-                        delete_side(cell_dict.get((cell.row_idx - 1, cell.col_idx)), 'bottom')
-                    if side == 'right':
-                        delete_side(cell_dict.get((cell.row_idx, cell.col_idx + 1)), 'left')
-                    if side == 'bottom':
-                        delete_side(cell_dict.get((cell.row_idx + 1, cell.col_idx)), 'top')
-                    if side == 'left':
-                        delete_side(cell_dict.get((cell.row_idx, cell.col_idx - 1)), 'right')
+    top, right, bottom, left = (static_values.SIDE_BITS[side] for side in static_values.BORDER_SIDES)
+    for c in range(len(masks) - 1):
+        if not (masks[c] & right and masks[c + 1] & left):
+            masks[c] &= ~right
+            masks[c + 1] &= ~left
+    for c in range(min(len(masks), len(previous_masks))):
+        if not (previous_masks[c] & bottom and masks[c] & top):
+            previous_masks[c] &= ~bottom
+            masks[c] &= ~top
+
 
+def apply_border_masks(row: List[ParsedCell], masks: List[int]):
+    """Records the default borders resolve_borders removed on the cells of a row"""
+    for cell in row:
+        cell.deleted_sides = cell.style.default_sides & ~masks[cell.col_idx]
 
-def fix_background_color(sheet_cells: List[List[ParsedCell]]):
+
+def fix_borders(sheet_cells: List[List[ParsedCell]], ws_meta: Dict=None):
     """
-    In an excel, a colored background hides the default border. This function makes the
-    same thing happen for the output HTML by deleting all default borders on each cell with
-    a background color.
+    Removes the default borders hidden by explicit borders and background colors, for a sheet that is
+    already in memory. See iter_fixed_rows.
 
     Arguments:
     sheet_cells: A list of lists of cells, with each inner list representing a row
+    ws_meta: unused, kept for compatibility
 
     Returns:
     None
     """
-    for row in sheet_cells:
+    for _ in iter_fixed_rows(sheet_cells):
+        pass
+
+
+def prefix_sums(sizes: Dict, default, first: int, count: int):
+    """
+    Builds the running totals of the sizes of count consecutive columns (or rows), so that the size of any span of them
+    is a single subtraction: offsets[i + span] - offsets[i].
+
+    Arguments:
+    sizes: the column_widths (or row_heights) of the sheet, keyed by 0-based index
+    default: the size of the columns (or rows) missing from sizes
+    first: the 0-based index of the first column (or row)
+    count: how many columns (or rows) to include
+
+    Returns:
+    a list of count + 1 offsets in pixels, starting at 0
+    """
+    offsets = [0]
+    for i in range(first, first + count):
+        offsets.append(offsets[-1] + sizes.get(i, default))
+    return offsets
+
+
+def span_size(sizes: Dict, default, first: int, span: int):
+    """
+    The size of a span of columns (or rows) without offsets, for the cells past the window load_sheet expected
+    (read-only worksheets can have more rows than their recorded dimensions). See prefix_sums for the arguments.
+    """
+    return sum(sizes.get(i, default) for i in range(first, first + span))
+
+
+def index_merged_cells(merged_cell_ranges, ws_meta: Dict):
+    """
+    Builds the merge index of a worksheet, so that every merge lookup is a single dictionary access.
+
+    Arguments:
+    merged_cell_ranges: the merged ranges of the worksheet
+    ws_meta: A dictionary containing global values for the worksheet (needs the view window)
+
+    Returns:
+    a dictionary mapping the 1-based (row, column) of each merge's top-left cell to its (rowspan, colspan) clamped to the view window,
+    and a dictionary mapping the first visible (row, column) of each merge whose top-left cell is above or left of the window to that top-left cell
+    """
+    def clamp_to_window(v, direction):
+        return max(ws_meta[f'min_{direction}'], min(v, ws_meta[f'max_{direction}']))
+
+    merge_spans = {}
+    clipped_merges = {}
+    for merge_range in merged_cell_ranges:
+        min_col, min_row, max_col, max_row = merge_range.bounds
+        top, left = clamp_to_window(min_row, 'row'), clamp_to_window(min_col, 'col')
+        rowspan = clamp_to_window(max_row, 'row') - top + 1
+        colspan = clamp_to_window(max_col, 'col') - left + 1
+        merge_spans[(min_row, min_col)] = (rowspan, colspan)
+        outside_window = (
+            max_row < ws_meta['min_row'] or min_row > ws_meta['max_row'] or
+            max_col < ws_meta['min_col'] or min_col > ws_meta['max_col']
+        )
+        if (top, left) != (min_row, min_col) and not outside_window:
+            clipped_merges[(top, left)] = (min_row, min_col)
+    return merge_spans, clipped_merges
+
+
+def load_workbook(pathname: str, openpyxl_kwargs: Dict=None, stats=None, engine: str='openpyxl'):
+    """
+    Loads a workbook and the global values shared by all of its sheets.
+
+    Arguments:
+    pathname: A path to the excel sheet
+    openpyxl_kwargs: A dicionary of arguments to pass to openpyxl.load_workbook
+    stats, engine: see main
+
+    Returns:
+    the openpyxl workbook and a dictionary containing global values for the workbook (wb_meta)
+    """
+    if engine not in static_values.ENGINES:
+        raise ValueError(f"engine must be one of {static_values.ENGINES}, not {engine!r}")
+    openpyxl, _, _, _ = import_dependencies()
+    openpyxl_kwargs = openpyxl_kwargs or {}  # just in case people are mutating openpyxl_kwargs between calls.
+    if engine == 'xml':  # openpyxl only reads the workbook-wide parts, see xml_engine
+        openpyxl_kwargs = {**openpyxl_kwargs, 'read_only': True}
+    with timed(stats, 'load_workbook'):
+        wb = openpyxl.load_workbook(pathname, **openpyxl_kwargs)
+    with timed(stats, 'theme_colors'):
+        themes = color_utilities.get_theme_colors(wb)
+    wb_meta = {
+        'themes': themes,
+        'read_only': bool(openpyxl_kwargs.get('read_only')),
+        'engine': engine,
+        'stats': stats,
+        'style_table': {},  # style ids are workbook-wide, see ParsedCell.handle_cell_style
+        'sheet_layouts': {},  # sheetname -> layout, see get_sheet_layout
+    }
+    return wb, wb_meta
+
+
+def check_budget_before_loading(pathname: str, openpyxl_kwargs: Dict, requests: Iterable, trim: bool, budget):
+    """
+    Checks the windows of a conversion against a budget (see budget.Budget.check_sheet) before the workbook is fully
+    loaded, since in openpyxl's default mode the load itself builds every cell and can take more memory than the
+    conversion. The workbook is opened in read-only mode for this, which only reads the sheets' dimensions and merges
+    (and scans their XML with trim). Read-only workbooks and the xml engine are cheap to load, and are checked as usual.
+
+    Arguments:
+    pathname, openpyxl_kwargs, trim, budget: see main
+    requests: tuples of (sheetname, min_row, max_row, min_col, max_col)
+
+    Returns:
+    None, a budget.BudgetExceeded is raised for the first window that is too big
+    """
+    wb, wb_meta = load_workbook(pathname, {**(openpyxl_kwargs or {}), 'read_only': True})
+    try:
+        for sheetname, *bounds in requests:
+            load_sheet(wb, wb_meta, sheetname, *bounds, trim, budget=budget)
+    finally:
+        wb.close()
+
+
+def needs_budget_check(openpyxl_kwargs: Dict, engine: str, budget):
+    """Whether check_budget_before_loading should run before loading a workbook"""
+    return budget is not None and engine == 'openpyxl' and not (openpyxl_kwargs or {}).get('read_only')
+
+
+def get_sheet_layout(ws, wb_meta: Dict):
+    """
+    Reads the parts of a worksheet that do not depend on the view window (merged cells, sizes, hyperlinks).
+    They are only read once per sheet, however many windows of it are converted.
+
+    Arguments:
+    ws: an openpyxl worksheet
+    wb_meta: A dictionary containing global values for the workbook, from load_workbook
+
+    Returns:
+    a dictionary of the sheet's merged_cell_ranges, hyperlinks, column_widths, default_col_width, row_heights,
+    default_row_height and dimensions (its last row and column, counted from the cells rather than taken from the
+    <dimension> element a read-only worksheet would go by)
+    """
+    layout = wb_meta['sheet_layouts'].get(ws.title)
+    if layout is not None:
+        return layout
+
+    openpyxl, _, read_only, xml_engine = import_dependencies()
+    sheet_xml = None
+    if wb_meta['engine'] == 'xml':
+        sheet_xml = xml_engine.read_sheet_xml(ws)
+        raw_layout = xml_engine.read_sheet_layout(ws, sheet_xml)
+    elif wb_meta['read_only']:
+        raw_layout = read_only.read_sheet_layout(ws)
+    else:
+        raw_layout = {
+            'merged_cell_ranges': ws.merged_cells.ranges,
+            'column_widths': {i: x.width for i, x in ws.column_dimensions.items()},
+            'row_heights': {i: x.height for i, x in ws.row_dimensions.items()},
+            'sheet_format': ws.sheet_format,
+            'hyperlinks': None,  # the cells carry their own hyperlinks
+            'dimensions': (ws.max_row, ws.max_column),
+        }
+    layout = wb_meta['sheet_layouts'][ws.title] = {
+        'merged_cell_ranges': raw_layout['merged_cell_ranges'],
+        'hyperlinks': raw_layout['hyperlinks'],
+        'column_widths': {(openpyxl.utils.cell.column_index_from_string(i) - 1): math.ceil(width * 7) for i, width in raw_layout['column_widths'].items()},  # converting excel units to pixels
+        'default_col_width': raw_layout['sheet_format'].defaultColWidth or 64,
+        'row_heights': {(i - 1): height * (4 / 3) for i, height in raw_layout['row_heights'].items() if height is not None},  # converting excel units to pixels
+        'default_row_height': raw_layout['sheet_format'].defaultRowHeight or 20,
+        'dimensions': (  # a regular worksheet counts the cells under its merges too, and a blank sheet is A1:A1
+            max([1, raw_layout['dimensions'][0]] + [merge_range.max_row for merge_range in raw_layout['merged_cell_ranges']]),
+            max([1, raw_layout['dimensions'][1]] + [merge_range.max_col for merge_range in raw_layout['merged_cell_ranges']]),
+        ),
+        'sheet_xml': sheet_xml,  # only kept for the xml engine
+    }
+    return layout
+
+
+def is_styled(wb, style):
+    """
+    Whether a cell with this style can be seen without a value, which is when it has a border or a fill.
+
+    Arguments:
+    wb: an openpyxl workbook
+    style: the openpyxl StyleArray of a cell
+    """
+    border = wb._borders[style.borderId]
+    sides = (border.left, border.right, border.top, border.bottom)
+    return any(side is not None and side.style is not None for side in sides) or wb._fills[style.fillId].patternType is not None
+
+
+def get_used_range(ws, wb_meta: Dict):
+    """
+    Finds the used range of a worksheet: the last row and column with a value, a border or a fill, or covered by a
+    merge. Sheets formatted all the way down, or with a stray styled cell far away, have a much smaller used range
+    than their dimensions. It is only worked out once per sheet. The read-only and xml engines scan the sheet's XML
+    for it, so a read-only sheet's XML is briefly held in memory.
+
+    Arguments:
+    ws: an openpyxl worksheet
+    wb_meta: A dictionary containing global values for the workbook, from load_workbook
+
+    Returns:
+    a tuple of the 1-based (row, column), (0, 0) for a blank sheet
+    """
+    layout = get_sheet_layout(ws, wb_meta)
+    if 'used_range' in layout:
+        return layout['used_range']
+
+    _, _, _, xml_engine = import_dependencies()
+    wb = ws.parent
+    if wb_meta['read_only']:
+        sheet_xml = layout['sheet_xml'] or xml_engine.read_sheet_xml(ws)
+        used_row, used_col = xml_engine.read_used_range(sheet_xml, lambda style_id: is_styled(wb, wb._cell_styles[style_id]))
+    else:
+        styled = {}
+        used_row = used_col = 0
+        for (row, col), cell in ws._cells.items():
+            if cell._value is None or cell._value == '':
+                key = (cell._style.borderId, cell._style.fillId)
+                if key not in styled:
+                    styled[key] = is_styled(wb, cell._style)
+                if not styled[key]:
+                    continue
+            used_row, used_col = max(used_row, row), max(used_col, col)
+    for merge_range in layout['merged_cell_ranges']:
+        used_row, used_col = max(used_row, merge_range.max_row), max(used_col, merge_range.max_col)
+    layout['used_range'] = (used_row, used_col)
+    return layout['used_range']
+
+
+def load_sheet(
+    wb,
+    wb_meta: Dict,
+    sheetname: str='Sheet1',
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    trim: bool=False,
+    collapse_blank_rows: int=None,
+    budget=None,
+    format_values: bool=False
+):
+    """
+    Gets a worksheet and the global values needed to parse a window of it. With a budget, the size of the window
+    is checked here, before any cell is parsed.
+
+    Arguments:
+    wb: an openpyxl workbook
+    wb_meta: A dictionary containing global values for the workbook, from load_workbook
+    sheetname, min_row, max_row, min_col, max_col, trim, collapse_blank_rows, budget, format_values: see main
+
+    Returns:
+    the openpyxl worksheet and a dictionary containing global values for the worksheet (ws_meta)
+    """
+    stats = wb_meta['stats']
+    with timed(stats, 'load_sheet'):
+        ws = wb[sheetname]
+        layout = get_sheet_layout(ws, wb_meta)
+        ws_meta = {
+            'themes': wb_meta['themes'],
+            'read_only': wb_meta['read_only'],
+            'engine': wb_meta['engine'],
+            'style_table': wb_meta['style_table'],
+            'stats': stats,
+            **layout,
+            'min_row': min_row or 1,
+            'min_col': min_col or 1,
+            'max_row': min(max_row or layout['dimensions'][0], layout['dimensions'][0]),
+            'max_col': min(max_col or layout['dimensions'][1], layout['dimensions'][1]),
+            'trimmed': trim and (max_row is None or max_col is None),
+            'collapse_blank_rows': collapse_blank_rows,
+            'budget': budget,
+            'format_values': format_values,
+        }
+        if ws_meta['trimmed']:  # the bounds that were left out stop at the used range instead
+            used_row, used_col = get_used_range(ws, wb_meta)
+            if max_row is None:
+                ws_meta['max_row'] = min(ws_meta['max_row'], max(used_row, ws_meta['min_row'] - 1))
+            if max_col is None:
+                ws_meta['max_col'] = min(ws_meta['max_col'], max(used_col, ws_meta['min_col'] - 1))
+        ws_meta['merge_spans'], ws_meta['clipped_merges'] = index_merged_cells(ws_meta['merged_cell_ranges'], ws_meta)
+        ws_meta['column_offsets'] = prefix_sums(
+            ws_meta['column_widths'], ws_meta['default_col_width'], ws_meta['min_col'] - 1, ws_meta['max_col'] + 1 - ws_meta['min_col']
+        )
+        ws_meta['row_offsets'] = prefix_sums(
+            ws_meta['row_heights'], ws_meta['default_row_height'], ws_meta['min_row'] - 1, ws_meta['max_row'] + 1 - ws_meta['min_row']
+        )
+    if stats is not None:
+        stats.counts['merged_ranges'] += len(ws_meta['merged_cell_ranges'])
+    if budget is not None:
+        budget.check_sheet(ws, ws_meta)
+    return ws, ws_meta
+
+
+def iter_sheet_cells(
+    ws,
+    ws_meta: Dict,
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None
+):
+    """
+    Reads the cells of the view window, row by row. Cells hidden under a merge are None, except for the
+    first visible cell of a merge whose top-left cell is outside the window, which is replaced by that top-left cell.
+
+    Arguments:
+    ws: an openpyxl worksheet
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+    min_row, max_row, min_col, max_col: the view window, see main
+
+    Returns:
+    a generator of tuples of cells (or None), one tuple per row, and no rows at all for an empty window
+    """
+    openpyxl, _, read_only, xml_engine = import_dependencies()
+    # the bounds that were left out are the sheet's dimensions from load_sheet (or its used range with trim),
+    # rather than the ones a read-only worksheet would take from its <dimension> element
+    max_row = ws_meta['max_row'] if max_row is None else max_row
+    max_col = ws_meta['max_col'] if max_col is None else max_col
+    if max_row < (min_row or 1) or max_col < (min_col or 1):  # an empty window, like a blank sheet with trim (openpyxl reads max_row=0 as no limit)
+        return
+    if ws_meta['engine'] == 'xml':
+        sheet_xml = ws_meta['sheet_xml']
+        yield from read_only.iter_sheet_cells(
+            ws, ws_meta, min_row, max_row, min_col, max_col,
+            iter_rows=functools.partial(xml_engine.iter_rows, ws, sheet_xml),
+            merge_style_ids=xml_engine.read_merge_style_ids(ws, ws_meta['merged_cell_ranges'], sheet_xml),
+        )
+        return
+    if ws_meta['read_only']:
+        yield from read_only.iter_sheet_cells(ws, ws_meta, min_row, max_row, min_col, max_col)
+        return
+
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+        cells = []
+        for cell in row:
+            if isinstance(cell, openpyxl.cell.cell.MergedCell):
+                parent = ws_meta['clipped_merges'].get((cell.row, cell.column))
+                if parent is None:
+                    cell = None
+                else:  # the top-left cell of this merge is outside the window, so the first visible cell stands in for it
+                    cell = ws.cell(row=parent[0], column=parent[1])
+            cells.append(cell)
+        yield tuple(cells)
+
+
+def iter_parsed_rows(sheet_rows: Iterable, ws_meta: Dict):
+    """
+    Parses the worksheet one row at a time.
+
+    Arguments:
+    sheet_rows: the rows of cells from iter_sheet_cells
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+
+    Returns:
+    a generator of ParsedRows, one per row
+    """
+    for i, row in enumerate(sheet_rows):
+        yield ParsedRow((ParsedCell(cell, ws_meta, i, j) for j, cell in enumerate(row) if cell is not None), ws_meta, i)
+
+
+def blank_row_key(row: List[ParsedCell]):
+    """
+    What makes a row of blank cells (no value, hyperlink, merge, border or fill) identical to another, see iter_collapsed_rows.
+
+    Returns:
+    a tuple of the position and style of each cell, or None if the row is not blank
+    """
+    for cell in row:
+        if (
+            cell.text != '' or cell.hyperlink is not None or cell.rowspan != 1 or
+            cell.style.has_background or cell.style.default_sides != static_values.ALL_SIDES
+        ):
+            return None
+    return tuple((cell.col_idx, cell.colspan, id(cell.style)) for cell in row)
+
+
+def iter_collapsed_rows(parsed_rows: Iterable[List[ParsedCell]], min_run: int):
+    """
+    Collapses every run of at least min_run identical blank rows (see blank_row_key) into its first row, made as tall
+    as the whole run. Only the gridlines between the rows of a run are lost. Rows reached by a merge from above
+    are never collapsed, since that would change the merge's rowspan.
+
+    Arguments:
+    parsed_rows: An iterable of lists of cells, with each inner list representing a row
+    min_run: the shortest run of rows to collapse
+
+    Returns:
+    a generator of rows
+    """
+    def flush(run):
+        if len(run) < min_run:
+            return run
+        height = sum(row.pixel_height for row in run)
+        run[0].pixel_height = height
+        for cell in run[0]:
+            cell.pixel_height = height
+        return run[:1]
+
+    run, run_key = [], None
+    covered_until = -1  # the last row reached by a merge so far
+    for row in parsed_rows:
+        key = blank_row_key(row) if row and row.row_idx > covered_until else None
         for cell in row:
-            if cell.font_style.get('background-color') is not None:
-                for side, is_default in cell.default_border.items():
-                    if is_default:
-                        delete_side(cell, side)
+            covered_until = max(covered_until, cell.row_idx + cell.rowspan - 1)
+        if key is not None and key == run_key:
+            run.append(row)
+            continue
+        yield from flush(run)
+        run, run_key = [], None
+        if key is None:
+            yield row
+        else:
+            run, run_key = [row], key
+    yield from flush(run)
+
+
+def iter_fixed_rows(parsed_rows: Iterable[List[ParsedCell]]):
+    """
+    Removes the default borders hidden by explicit borders and background colors over a stream of rows,
+    see border_masks and resolve_borders. A row is yielded as soon as the row below it has been seen,
+    since that is the last row that can change its borders.
+
+    Arguments:
+    parsed_rows: An iterable of lists of cells, with each inner list representing a row
+
+    Returns:
+    a generator of the same rows, with their borders fixed
+    """
+    previous_row, previous_masks = None, []
+    for row in parsed_rows:
+        masks = border_masks(row)
+        resolve_borders(masks, previous_masks)
+        if previous_row is not None:
+            apply_border_masks(previous_row, previous_masks)
+            yield previous_row
+        previous_row, previous_masks = row, masks
+    if previous_row is not None:
+        apply_border_masks(previous_row, previous_masks)
+        yield previous_row
+
+
+def iter_sheet_html(
+    ws,
+    ws_meta: Dict,
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    style_classes: Dict=None,
+    compact: bool=False
+):
+    """
+    Parses, fixes and renders a window of a loaded worksheet, one row at a time.
+
+    Arguments:
+    ws: an openpyxl worksheet
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+    min_row, max_row, min_col, max_col: the view window, see main
+    style_classes: see iter_table_html
+    compact: render the table the way style_mode='compact' does, see compact_row
+
+    Returns:
+    a generator of strings that together form the HTML table
+    """
+    stats = ws_meta['stats']
+    if stats is None:
+        sheet_rows = iter_sheet_cells(ws, ws_meta, min_row, max_row, min_col, max_col)
+        parsed_rows = iter_parsed_rows(sheet_rows, ws_meta)
+        if ws_meta['collapse_blank_rows']:
+            parsed_rows = iter_collapsed_rows(parsed_rows, ws_meta['collapse_blank_rows'])
+        column_widths = get_column_widths(ws_meta) if compact else None
+        chunks = iter_table_html(iter_fixed_rows(parsed_rows), style_classes, column_widths)
+    else:
+        chunks = iter_timed_sheet_html(ws, ws_meta, min_row, max_row, min_col, max_col, style_classes, compact)
+    if ws_meta['budget'] is not None:
+        chunks = ws_meta['budget'].iter_tracked(chunks, stats)
+    return chunks
+
+
+def iter_timed_sheet_html(
+    ws,
+    ws_meta: Dict,
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    style_classes: Dict=None,
+    compact: bool=False
+):
+    """
+    iter_sheet_html with every stage timed and counted in ws_meta['stats'], see stats.ConversionStats.
+    """
+    stats = ws_meta['stats']
+    sheet_rows = stats.iter_timed(iter_sheet_cells(ws, ws_meta, min_row, max_row, min_col, max_col), 'read_cells')
+    parsed_rows = iter_parsed_rows(sheet_rows, ws_meta)
+    if ws_meta['collapse_blank_rows']:
+        parsed_rows = iter_collapsed_rows(parsed_rows, ws_meta['collapse_blank_rows'])
+    parsed_rows = stats.iter_timed(parsed_rows, 'parse_cells')
+    fixed_rows = stats.iter_timed(iter_fixed_rows(parsed_rows), 'fix_borders')
+    counts = stats.counts
+    with stats.timed('render'):  # compiles the template the first time
+        column_widths = get_column_widths(ws_meta) if compact else None
+        chunks = iter_table_html(count_rows(fixed_rows, counts), style_classes, column_widths)
+    for chunk in stats.iter_timed(chunks, 'render'):
+        counts['output_bytes'] += len(chunk.encode('utf-8'))
+        yield chunk
+    counts['distinct_styles'] = len(ws_meta['style_table'])
+
+
+def count_rows(rows: Iterable[List[ParsedCell]], counts: Dict):
+    """Counts the rows and cells passing through, see iter_timed_sheet_html"""
+    for row in rows:
+        counts['rows'] += 1
+        counts['cells'] += len(row)
+        yield row
+
+
+def render_sheet(
+    ws,
+    ws_meta: Dict,
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    style_mode: str='inline',
+    out=None
+):
+    """
+    Converts a window of a loaded worksheet, returning (or writing) the same thing main does.
+
+    Arguments:
+    ws: an openpyxl worksheet
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+    min_row, max_row, min_col, max_col, style_mode, out: see main
+    """
+    style_classes = None if style_mode in ('inline', 'compact') else {}
+    chunks = iter_sheet_html(ws, ws_meta, min_row, max_row, min_col, max_col, style_classes, style_mode == 'compact')
+    if out is not None:
+        with timed(ws_meta['stats'], 'write'):
+            for chunk in chunks:
+                out.write(chunk)
+        return to_css(style_classes) if style_mode == 'separate' else None
+
+    with timed(ws_meta['stats'], 'write'):
+        body = ''.join(chunks)
+    return finish_html(body, style_classes, style_mode)
+
+
+def finish_html(body: str, style_classes: Dict, style_mode: str):
+    """
+    Puts a rendered table and the style classes collected while rendering it together, the way main returns them.
+
+    Arguments:
+    body: the HTML table
+    style_classes: the style_classes given to iter_sheet_html (None with style_mode='inline' or 'compact')
+    style_mode: see main
+    """
+    if style_mode == 'class':
+        return f'<style>\n{to_css(style_classes)}\n</style>' + body
+    if style_mode == 'separate':
+        return body, to_css(style_classes)
+    return body
+
+
+def check_style_mode(style_mode: str, out=None):
+    """
+    Raises a ValueError if style_mode is not one of static_values.STYLE_MODES, or cannot be written to out.
+    """
+    if style_mode not in static_values.STYLE_MODES:
+        raise ValueError(f"style_mode must be one of {static_values.STYLE_MODES}, not {style_mode!r}")
+    if out is not None and style_mode == 'class':
+        raise ValueError("style_mode='class' cannot be streamed to out, use style_mode='separate' instead")
+
+
+def iter_html(
+    pathname: str,
+    sheetname: str='Sheet1',
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    openpyxl_kwargs: Dict=None,
+    style_classes: Dict=None,
+    stats=None,
+    engine: str='openpyxl',
+    compact: bool=False,
+    trim: bool=False,
+    collapse_blank_rows: int=None,
+    budget=None,
+    format_values: bool=False
+):
+    """
+    iter_html is the streaming version of main. Rows are parsed, fixed and rendered one at a time,
+    so only a few rows of ParsedCells are alive at once.
+
+    Arguments:
+    pathname, sheetname, min_row, max_row, min_col, max_col, openpyxl_kwargs: see main
+    style_classes: If given, each distinct cell style is interned into this dictionary (style -> class name),
+        see to_css to turn it into a stylesheet once the generator is exhausted
+    stats, engine: see main
+    compact: render the table the way style_mode='compact' does (style_classes is ignored then)
+    trim, collapse_blank_rows, budget, format_values: see main
+
+    Returns:
+    a generator of strings that together form the HTML table
+    """
+    if needs_budget_check(openpyxl_kwargs, engine, budget):
+        check_budget_before_loading(pathname, openpyxl_kwargs, [(sheetname, min_row, max_row, min_col, max_col)], trim, budget)
+    wb, wb_meta = load_workbook(pathname, openpyxl_kwargs, stats, engine)
+    try:
+        ws, ws_meta = load_sheet(wb, wb_meta, sheetname, min_row, max_row, min_col, max_col, trim, collapse_blank_rows, budget, format_values)
+        yield from iter_sheet_html(ws, ws_meta, min_row, max_row, min_col, max_col, style_classes, compact)
+    finally:
+        if wb_meta['read_only']:  # read-only workbooks keep the file open until closed
+            wb.close()
+
+
+def convert_many(
+    pathname: str,
+    requests: Iterable,
+    openpyxl_kwargs: Dict=None,
+    style_mode: str='inline',
+    stats=None,
+    cache=None,
+    engine: str='openpyxl',
+    trim: bool=False,
+    collapse_blank_rows: int=None,
+    budget=None,
+    format_values: bool=False
+):
+    """
+    convert_many converts several sheets and/or windows of the same workbook. The workbook, its theme, its style
+    table and the layout of each sheet are only loaded once, however many requests there are.
+
+    Arguments:
+    pathname: A path to the excel sheet
+    requests: An iterable of requests. Each request is either a sheetname, or a tuple of
+        (sheetname, min_row, max_row, min_col, max_col) where trailing bounds can be left off
+    openpyxl_kwargs: A dicionary of arguments to pass to openpyxl.load_workbook
+    style_mode: see main
+    stats: see main, the phases and counters add up over all of the requests
+    cache: see main, the workbook is only loaded if some of the requests are not cached
+    engine, trim, collapse_blank_rows: see main
+    budget: see main, every request is checked against it on its own
+    format_values: see main
+
+    Returns:
+    a dictionary mapping each request to what main would return for it
+    """
+    check_style_mode(style_mode)
+    file_hash = None if cache is None else content_hash(pathname)
+    wb = wb_meta = None
+    try:
+        results = {}
+        for request in requests:
+            sheetname, *bounds = (request,) if isinstance(request, str) else request
+            bounds += [None] * (4 - len(bounds))
+            if cache is not None:
+                key = cache_key(file_hash, sheetname, tuple(bounds), openpyxl_kwargs, style_mode, {'trim': trim, 'collapse_blank_rows': collapse_blank_rows, 'format_values': format_values}, engine)
+                hit = cache.get(key)
+                if hit is not None:
+                    results[request] = from_cached(*hit, style_mode)
+                    continue
+            if wb is None:
+                if needs_budget_check(openpyxl_kwargs, engine, budget):  # the later requests are checked once the workbook is loaded
+                    check_budget_before_loading(pathname, openpyxl_kwargs, [(sheetname, *bounds)], trim, budget)
+                wb, wb_meta = load_workbook(pathname, openpyxl_kwargs, stats, engine)
+            ws, ws_meta = load_sheet(wb, wb_meta, sheetname, *bounds, trim, collapse_blank_rows, budget, format_values)
+            results[request] = render_sheet(ws, ws_meta, *bounds, style_mode=style_mode)
+            if cache is not None:
+                cache.put(key, *to_cached(results[request], style_mode))
+        return results
+    finally:
+        if wb_meta is not None and wb_meta['read_only']:
+            wb.close()
+
+
+def to_cached(result, style_mode: str):
+    """Turns what render_sheet returned into the (html, css) stored by a cache.HTMLCache"""
+    return result if style_mode == 'separate' else (result, None)
+
+
+def from_cached(html: str, css: str, style_mode: str, out=None):
+    """Returns (or writes to out) a cached conversion the same way render_sheet would"""
+    if out is not None:
+        out.write(html)
+        return css if style_mode == 'separate' else None
+    return (html, css) if style_mode == 'separate' else html
 
 
 def main(
@@ -342,7 +1399,16 @@ def main(
     max_row: int=None,
     min_col: int=None,
     max_col: int=None,
-    openpyxl_kwargs: Dict=None
+    openpyxl_kwargs: Dict=None,
+    style_mode: str='inline',
+    out=None,
+    stats=None,
+    cache=None,
+    engine: str='openpyxl',
+    trim: bool=False,
+    collapse_blank_rows: int=None,
+    budget=None,
+    format_values: bool=False
 ):
     """
     main is the main function. It accepts details about a excel sheet and returns an HTML table matching it.
@@ -355,48 +1421,51 @@ def main(
     min_col: The minimum column to parse in the excel (1-based)
     max_col: The maximum column to parse in the excel (1-based)
     openpyxl_kwargs: A dicionary of arguments to pass to openpyxl.load_workbook
+    style_mode: How the cell styles are output. One of
+        'inline': every cell gets its own style attribute (the default)
+        'class': each distinct style becomes a class, defined in a <style> block placed before the table
+        'separate': like 'class', but returns a tuple of (table, stylesheet) instead of a single string
+        'compact': like 'inline', but a lot smaller. The widths go on a <colgroup>, the heights and the font and
+            alignment shared by a row go on its <tr>, and redundant borders and attributes are left out, see compact_row
+    out: An optional file-like object. If given, the table is written to it row by row instead of being returned
+        (with style_mode='separate' the stylesheet is still returned). style_mode='class' is not supported
+        here, since the <style> block can only be written once every row has been seen.
+    stats: An optional stats.ConversionStats, which is filled in with the time taken by each phase of the conversion
+        and counters such as the number of cells parsed. Nothing is measured without one.
+    cache: An optional cache.HTMLCache. The result is looked up by the workbook's contents and the other arguments,
+        and on a hit it is returned without opening the workbook. On a miss the result is stored, which means
+        that with out it is rendered in memory before being written.
+    engine: How the cells are read. One of
+        'openpyxl': through openpyxl's worksheet (the default, or its read-only worksheet with openpyxl_kwargs={'read_only': True})
+        'xml': straight from the sheet's XML, see xml_engine. This is faster on large sheets, but the sheet's XML is
+            kept in memory while it is converted. openpyxl still reads the styles, strings and theme, in read-only mode.
+    trim: Stop at the used range of the sheet (see get_used_range) instead of its dimensions, when max_row or max_col
+        is left out. Trailing rows and columns without a value, border or fill are left out
+    collapse_blank_rows: If given, every run of at least this many identical blank rows is rendered as a single
+        row as tall as the run, see iter_collapsed_rows
+    budget: An optional budget.Budget. The conversion fails with a budget.BudgetExceeded as soon as it goes over the
+        budget's max_cells or max_memory, and the budget's peak_memory is set to the memory it used at its peak.
+        In openpyxl's default mode the window is checked before the workbook is loaded, see check_budget_before_loading.
+    format_values: Show the values the way excel displays them under their number format (cell.number_format), like
+        '1,234.50', '12%' or '5-Mar-20', instead of as they are stored. Zeros are shown too. Each distinct number
+        format is compiled once and shared by every cell of its style, see number_formats.compile_format
     """
-    def out_of_range(bounds):
-        '''bounds are of the form (left_col, top_row, right_col, bottom_row)'''
-        return (bounds[0] < (min_col or 0)) or (bounds[1] < (min_row or 0))
-
-    openpyxl_kwargs = openpyxl_kwargs or {}  # just in case people are mutating openpyxl_kwargs between calls.
-    wb = openpyxl.load_workbook(pathname, **openpyxl_kwargs)
-    ws = wb[sheetname]
-    ws_meta = {
-        'themes': color_utilities.get_theme_colors(wb),
-        'merged_cell_ranges': ws.merged_cells.ranges,
-        'column_widths': {(openpyxl.utils.cell.column_index_from_string(i) - 1): math.ceil(x.width * 7) for i, x in ws.column_dimensions.items()},  # converting excel units to pixels
-        'default_col_width': ws.sheet_format.defaultColWidth or 64,
-        'row_heights': {(i - 1): x.height * (4 / 3) for i, x in ws.row_dimensions.items()},  # converting excel units to pixels
-        'default_row_height': ws.sheet_format.defaultRowHeight or 20,
-        'min_row': min_row or 1,
-        'min_col': min_col or 1,
-        'max_row': min(max_row or ws.max_row, ws.max_row),
-        'max_col': min(max_col or ws.max_column, ws.max_column),
-    }
-    parsed_sheet = []
-    candidate_merge_ranges = [x for x in ws.merged_cells.ranges if out_of_range(x.bounds)]
-    for i, row in enumerate(ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)):
-        parsed_row = []
-        for j, cell in enumerate(row):
-            if isinstance(cell, openpyxl.cell.cell.Cell):
-                parsed_row.append(ParsedCell(cell, ws_meta, i, j))
-            else:
-                for i, candidate_range in enumerate(candidate_merge_ranges):
-                    if cell.coordinate in candidate_range:
-                        parent_cell = ws.cell(row=candidate_range.bounds[1], column=candidate_range.bounds[0])
-                        parsed_row.append(ParsedCell(parent_cell, ws_meta, i, j))
-                        candidate_merge_ranges.pop(i)
-                        break
-        parsed_sheet.append(parsed_row)
-
-    # it's important to first run background_color and then fix_borders, so that
-    # the border can be deleted on the cell in fix_background_color. Then you
-    # need to run fix_borders so their neighbors can also have their borders
-    # deleted. That's part of the reason we make default_border = False when
-    # running delete_side
-    fix_background_color(parsed_sheet)
-    fix_borders(parsed_sheet, ws_meta)
-    body = to_html(parsed_sheet)
-    return body
+    check_style_mode(style_mode, out)
+    if cache is not None:
+        bounds = (min_row, max_row, min_col, max_col)
+        options = {'trim': trim, 'collapse_blank_rows': collapse_blank_rows, 'format_values': format_values}
+        key = cache_key(content_hash(pathname), sheetname, bounds, openpyxl_kwargs, style_mode, options, engine)
+        hit = cache.get(key)
+        if hit is None:
+            hit = to_cached(main(pathname, sheetname, *bounds, openpyxl_kwargs, style_mode, stats=stats, engine=engine, budget=budget, **options), style_mode)
+            cache.put(key, *hit)
+        return from_cached(*hit, style_mode, out)
+    if needs_budget_check(openpyxl_kwargs, engine, budget):
+        check_budget_before_loading(pathname, openpyxl_kwargs, [(sheetname, min_row, max_row, min_col, max_col)], trim, budget)
+    wb, wb_meta = load_workbook(pathname, openpyxl_kwargs, stats, engine)
+    try:
+        ws, ws_meta = load_sheet(wb, wb_meta, sheetname, min_row, max_row, min_col, max_col, trim, collapse_blank_rows, budget, format_values)
+        return render_sheet(ws, ws_meta, min_row, max_row, min_col, max_col, style_mode, out)
+    finally:
+        if wb_meta['read_only']:  # read-only workbooks keep the file open until closed
+            wb.close()
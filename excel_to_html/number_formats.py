@@ -0,0 +1,498 @@
+"""
+Renders cell values the way Excel displays them under their number format (cell.number_format, like '#,##0.00',
+'0%', '"$"#,##0_);("$"#,##0)' or 'd-mmm-yy'). Each distinct format is compiled once by compile_format into a function
+of a cell value, and the compiled functions are cached, so formatting a value costs a single call.
+
+The sections (positive;negative;zero;text), conditions ([>=100]), currency symbols ([$€-407]), quoted and escaped
+literals, digit placeholders (0 # ?), thousands separators and scaling commas, percentages, scientific notation,
+fractions, dates, times and elapsed times ([h]:mm) are supported. Colors ([Red]) and fill characters (*) are ignored,
+and month and day names are in English.
+"""
+try:
+    import static_values
+except ModuleNotFoundError:
+    from . import static_values
+import datetime
+import decimal
+import fractions
+import functools
+import re
+
+
+TOKEN = re.compile(r'''
+    (?P<quoted>"[^"]*"?)
+    |(?P<escaped>\\.)
+    |(?P<space>_.?)
+    |(?P<fill>\*.?)
+    |(?P<bracket>\[[^\]]*\]?)
+    |(?P<ampm>AM/PM|A/P)
+    |(?P<exponent>E[+-])
+    |(?P<general>General)
+    |(?P<date>y+|m+|d+|h+|s+)
+    |(?P<digit>[0\#?])
+    |(?P<char>.)
+''', re.VERBOSE | re.IGNORECASE | re.DOTALL)
+CONDITION = re.compile(r'\s*(<=|>=|<>|<|>|=)\s*(-?\d+(?:\.\d*)?)\s*')
+ELAPSED = re.compile(r'h+|m+|s+', re.IGNORECASE)
+CHAR_KINDS = {';': 'separator', '.': 'point', ',': 'comma', '%': 'percent', '@': 'text', '/': 'slash'}
+COMPARISONS = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+}
+EPOCH = datetime.datetime(1899, 12, 30)  # day 0 of Excel's dates (in the 1900 date system, past its phantom 29 Feb 1900)
+MAX_SERIAL = 2958466  # the first day past 31 Dec 9999
+DECIMAL_CONTEXT = decimal.Context(prec=400, rounding=decimal.ROUND_HALF_UP)  # exact for any float, and Excel rounds halves up
+
+
+def format_general(value):
+    """
+    How Excel's General format displays a value: numbers with at most 15 significant digits, booleans as
+    TRUE and FALSE, and everything else (strings, and dates without a date format) as it is.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return f'{value:.15g}'.replace('e', 'E')
+    return str(value)
+
+
+def to_decimal(value):
+    """A number as a Decimal, floats by their shortest repr so that 0.125 stays a tie that rounds up"""
+    if isinstance(value, float):
+        return decimal.Decimal(repr(value))
+    return decimal.Decimal(value)
+
+
+def to_serial(value):
+    """A datetime, date, time or timedelta as Excel stores it, in days since EPOCH"""
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400
+    if isinstance(value, datetime.datetime):
+        return (value - EPOCH).total_seconds() / 86400
+    if isinstance(value, datetime.date):
+        return (value - EPOCH.date()).days
+    return (value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6) / 86400
+
+
+def tokenize(format_code: str):
+    """
+    Splits a number format into tokens.
+
+    Returns:
+    a list of (kind, text) tuples, the kinds being literal, separator (between sections), point, comma, percent, text (@),
+        slash, ampm, exponent, general, date (a run of y, m, d, h or s), elapsed ([h], [mm], ...), digit (0, # or ?)
+        and condition (whose text is an (operator, number) tuple)
+    """
+    tokens = []
+    for match in TOKEN.finditer(format_code):
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'quoted':
+            tokens.append(('literal', text[1:-1] if text.endswith('"') and len(text) > 1 else text[1:]))
+        elif kind == 'escaped':
+            tokens.append(('literal', text[1]))
+        elif kind == 'space':  # as wide as the character after it, most often to line up with the parentheses of negatives
+            tokens.append(('literal', ' '))
+        elif kind == 'bracket':
+            inner = text[1:-1] if text.endswith(']') else text[1:]
+            condition = CONDITION.fullmatch(inner)
+            if condition is not None:
+                tokens.append(('condition', (condition.group(1), float(condition.group(2)))))
+            elif inner.startswith('$'):  # [$symbol-locale], the locale is ignored
+                tokens.append(('literal', inner[1:].split('-')[0]))
+            elif ELAPSED.fullmatch(inner):
+                tokens.append(('elapsed', inner.lower()))
+            # colors ([Red], [Color10]) and the other switches are ignored
+        elif kind == 'char':
+            tokens.append((CHAR_KINDS.get(text, 'literal'), text))
+        elif kind != 'fill':
+            tokens.append((kind, text))
+    return tokens
+
+
+def split_sections(tokens):
+    sections = [[]]
+    for token in tokens:
+        if token[0] == 'separator':
+            sections.append([])
+        else:
+            sections[-1].append(token)
+    return sections
+
+
+class Section:
+    """
+    One section of a number format, compiled by compile_section.
+    """
+    __slots__ = ('kind', 'condition', 'render')
+
+    def __init__(self, kind: str, condition, render):
+        self.kind = kind  # number, date, text or literal (no placeholders at all, like the "-" of zeros in accounting)
+        self.condition = condition  # an (operator, number) tuple or None
+        self.render = render  # a function of a value, numbers are passed without their sign
+
+    def matches(self, value):
+        return self.condition is None or COMPARISONS[self.condition[0]](value, self.condition[1])
+
+    def shows_sign(self):
+        """Whether negative numbers get a minus sign in front of this section, which they do unless its condition only takes negatives"""
+        return self.condition is None or not (self.condition[0] in ('<', '<=') and self.condition[1] <= 0)
+
+
+def compile_section(tokens):
+    condition = next((text for kind, text in tokens if kind == 'condition'), None)
+    tokens = [(kind, text) for kind, text in tokens if kind != 'condition']
+    kinds = {kind for kind, _ in tokens}
+    if kinds & {'date', 'elapsed', 'ampm'}:
+        return Section('date', condition, compile_date(tokens))
+    if 'text' in kinds:
+        return Section('text', condition, lambda value: ''.join(value if kind == 'text' else text for kind, text in tokens))
+    if kinds & {'digit', 'general'}:
+        return Section('number', condition, compile_number(tokens))
+    literal = ''.join(text for _, text in tokens)
+    return Section('literal', condition, lambda value: literal)
+
+
+def fill_integer(tokens, digits: str, thousands: bool=False):
+    """
+    Fills the integer digit placeholders (and the literals between them) from the right. The leftmost placeholder
+    takes all the digits left over, and the placeholders without a digit show 0 for 0, a space for ? and nothing for #.
+    """
+    placeholders = sum(kind == 'digit' for kind, _ in tokens)
+    pieces = []  # in reverse
+    end = len(digits)
+    count = 0  # digits placed so far, for the thousands separators
+    for kind, text in reversed(tokens):
+        if kind != 'digit':
+            pieces.append(text)
+            continue
+        placeholders -= 1
+        start = 0 if placeholders == 0 else max(end - 1, 0)
+        taken, end = digits[start:end], start
+        if not taken:
+            taken = '0' if text == '0' else ' ' if text == '?' else ''
+        for digit in reversed(taken):
+            if thousands and count and count % 3 == 0 and digit != ' ':
+                pieces.append(',')
+            pieces.append(digit)
+            count += digit != ' '
+    return ''.join(reversed(pieces))
+
+
+def fill_fraction(tokens, digits: str):
+    """
+    Fills the digit placeholders after the decimal point from the left. Trailing zeros show as 0 for 0, a space for ? and nothing for #.
+    """
+    significant = len(digits.rstrip('0'))
+    pieces = []
+    i = 0
+    for kind, text in tokens:
+        if kind != 'digit':
+            pieces.append(text)
+            continue
+        pieces.append(digits[i] if i < significant or text == '0' else ' ' if text == '?' else '')
+        i += 1
+    return ''.join(pieces)
+
+
+def round_half_up(value: decimal.Decimal, decimals: int):
+    return value.quantize(decimal.Decimal(1).scaleb(-decimals), context=DECIMAL_CONTEXT)
+
+
+def compile_number(tokens):
+    """
+    Compiles a section with digit placeholders into a function of a number (without its sign).
+    """
+    percents = sum(kind == 'percent' for kind, _ in tokens)
+    if any(kind == 'general' for kind, _ in tokens):
+        return lambda value: ''.join(format_general(value * 100 ** percents) if kind == 'general' else text for kind, text in tokens)
+    scale = decimal.Decimal(100) ** percents
+
+    digit_indices = [i for i, (kind, _) in enumerate(tokens) if kind == 'digit']
+    slash = next((i for i, (kind, _) in enumerate(tokens) if kind == 'slash' and digit_indices[0] < i < digit_indices[-1]), None)
+    if slash is not None:
+        return compile_fraction(tokens, slash, scale)
+
+    exponent = next((i for i, (kind, _) in enumerate(tokens) if kind == 'exponent'), len(tokens))
+    mantissa, exponent_tokens = tokens[:exponent], tokens[exponent + 1:]
+    last_digit = max((i for i in digit_indices if i < exponent), default=-1)
+    i = last_digit + 1
+    while i < len(mantissa) and mantissa[i][0] == 'comma':  # each comma after the last digit divides by a thousand
+        scale /= 1000
+        i += 1
+    mantissa = mantissa[:last_digit + 1] + mantissa[i:]
+
+    point = next((i for i, (kind, _) in enumerate(mantissa) if kind == 'point'), len(mantissa))
+    int_tokens, frac_tokens = mantissa[:point], mantissa[point + 1:]
+    int_digits = [i for i, (kind, _) in enumerate(int_tokens) if kind == 'digit']
+    thousands = any(kind == 'comma' and int_digits and int_digits[0] < i < int_digits[-1] for i, (kind, _) in enumerate(int_tokens))
+    if thousands:
+        int_tokens = [(kind, text) for i, (kind, text) in enumerate(int_tokens) if not (kind == 'comma' and int_digits[0] < i < int_digits[-1])]
+    int_placeholders = ''.join(text for kind, text in int_tokens if kind == 'digit')
+    frac_placeholders = ''.join(text for kind, text in frac_tokens if kind == 'digit')
+    decimals = len(frac_placeholders)
+    point_text = '.' if point < len(mantissa) else ''
+
+    if exponent < len(tokens):
+        return compile_scientific(int_tokens, frac_tokens, point_text, tokens[exponent][1], exponent_tokens, scale)
+
+    first = next((i for i, (kind, _) in enumerate(int_tokens) if kind == 'digit'), len(int_tokens))
+    last = max((i for i, (kind, _) in enumerate(int_tokens) if kind == 'digit'), default=len(int_tokens) - 1)
+    prefix = ''.join(text for _, text in int_tokens[:first])
+    suffix = ''.join(text for _, text in int_tokens[last + 1:]) if not point_text else ''
+    int_tokens = int_tokens[first:last + 1] if not point_text else int_tokens[first:]
+    if (
+        all(kind == 'digit' for kind, _ in int_tokens) and re.fullmatch('#*0*', int_placeholders)
+        and all(kind == 'digit' for kind, _ in frac_tokens[:decimals]) and set(frac_placeholders) <= {'0'}
+    ):  # the common formats ('0.00', '#,##0', '0%'...) come down to a format spec
+        suffix += ''.join(text for _, text in frac_tokens[decimals:])
+        min_digits = int_placeholders.count('0')
+        width = min_digits + (thousands and (min_digits - 1) // 3) + (decimals and decimals + 1) if min_digits > 1 else ''
+        spec = f"{'0' if width else ''}{width}{',' if thousands else ''}.{decimals}f"
+
+        def render(value):
+            text = format(round_half_up(DECIMAL_CONTEXT.multiply(to_decimal(value), scale), decimals), spec)
+            if not min_digits and text.startswith('0'):
+                text = text[1:]
+            return f'{prefix}{text}{point_text if not decimals else ""}{suffix}'
+        return render
+
+    def render(value):
+        integer, _, fraction = format(round_half_up(DECIMAL_CONTEXT.multiply(to_decimal(value), scale), decimals), 'f').partition('.')
+        text = fill_integer(int_tokens, integer.lstrip('0'), thousands)
+        return f'{prefix}{text}{point_text}{fill_fraction(frac_tokens, fraction)}{suffix}'
+    return render
+
+
+def compile_scientific(int_tokens, frac_tokens, point_text: str, exponent_text: str, exponent_tokens, scale: decimal.Decimal):
+    """
+    Compiles a section in scientific notation (with E+ or E-). With more than one integer placeholder and a #
+    among them, the exponent is kept to a multiple of the number of integer placeholders (engineering notation).
+    """
+    int_placeholders = ''.join(text for kind, text in int_tokens if kind == 'digit')
+    decimals = sum(kind == 'digit' for kind, _ in frac_tokens)
+    width = max(len(int_placeholders), 1)
+    step = width if len(int_placeholders) > 1 and '#' in int_placeholders else 1
+
+    def split(value: decimal.Decimal):
+        exponent = value.adjusted() if value else 0
+        exponent = exponent - exponent % step if step > 1 else exponent - (width - 1)
+        mantissa = round_half_up(value.scaleb(-exponent), decimals)
+        if mantissa.adjusted() >= width:  # rounded up to one digit too many, like 9.996 to 10.00
+            exponent += step
+            mantissa = round_half_up(value.scaleb(-exponent), decimals)
+        return mantissa, exponent
+
+    def render(value):
+        mantissa, exponent = split(DECIMAL_CONTEXT.multiply(to_decimal(value), scale))
+        integer, _, fraction = format(mantissa, 'f').partition('.')
+        sign = '-' if exponent < 0 else '+' if exponent_text[1] == '+' else ''
+        return (
+            f'{fill_integer(int_tokens, integer.lstrip("0"))}{point_text}{fill_fraction(frac_tokens, fraction)}'
+            f'{exponent_text[0]}{sign}{fill_integer(exponent_tokens, str(abs(exponent)))}'
+        )
+    return render
+
+
+def compile_fraction(tokens, slash: int, scale: decimal.Decimal):
+    """
+    Compiles a section with a fraction, like '# ?/?' (a whole part and up to one digit denominators), '?/??'
+    (an improper fraction) or '# ??/100' (a fixed denominator).
+    """
+    end = slash + 1
+    while end < len(tokens) and tokens[end][0] in ('digit', 'literal') and len(tokens[end][1]) == 1 and tokens[end][1] in '0123456789#?':
+        end += 1
+    denominator_text = ''.join(text for _, text in tokens[slash + 1:end])
+    fixed = int(denominator_text) if denominator_text[:1] in tuple('123456789') and denominator_text.isdigit() else None
+    start = slash
+    while start > 0 and tokens[start - 1][0] == 'digit':
+        start -= 1
+    numerator_tokens = tokens[start:slash]
+    whole_end = start
+    while whole_end > 0 and tokens[whole_end - 1][0] != 'digit':
+        whole_end -= 1
+    whole_start = whole_end
+    while whole_start > 0 and tokens[whole_start - 1][0] in ('digit', 'comma'):
+        whole_start -= 1
+    prefix = ''.join(text for _, text in tokens[:whole_start])
+    whole_tokens = tokens[whole_start:whole_end]
+    middle = ''.join(text for _, text in tokens[whole_end:start])
+    suffix = ''.join(text for _, text in tokens[end:])
+    max_denominator = max(10 ** len(denominator_text) - 1, 1)
+
+    def render(value):
+        value = DECIMAL_CONTEXT.multiply(to_decimal(value), scale)
+        whole = int(value) if whole_tokens else 0
+        part = value - whole
+        if fixed is None:
+            part = fractions.Fraction(part).limit_denominator(max_denominator)
+            numerator, denominator = part.numerator, part.denominator
+        else:
+            numerator, denominator = int(round_half_up(part * fixed, 0)), fixed
+        if whole_tokens and numerator == denominator:
+            whole, numerator = whole + 1, 0
+        if whole_tokens and numerator == 0:
+            return f'{prefix}{fill_integer(whole_tokens, str(whole))}{suffix}'
+        whole_text = fill_integer(whole_tokens, str(whole) if whole else '')
+        shown = str(denominator) if fixed is not None else str(denominator).ljust(len(denominator_text))
+        return f'{prefix}{whole_text}{middle}{fill_integer(numerator_tokens, str(numerator))}/{shown}{suffix}'
+    return render
+
+
+def compile_date(tokens):
+    """
+    Compiles a section with dates or times into a function of a datetime, date, time, timedelta or number of days (see to_serial).
+    An m or mm right after an hour or right before a second is a minute, otherwise a month.
+    """
+    twelve_hour = any(kind == 'ampm' for kind, _ in tokens)
+    time_codes = [(i, kind, text[0].lower()) for i, (kind, text) in enumerate(tokens) if kind in ('date', 'elapsed')]
+    minutes = set()
+    for n, (i, kind, code) in enumerate(time_codes):
+        if kind == 'date' and code == 'm' and len(tokens[i][1]) <= 2:
+            before = time_codes[n - 1][2] if n else None
+            after = time_codes[n + 1][2] if n + 1 < len(time_codes) else None
+            if before == 'h' or after == 's':
+                minutes.add(i)
+    has_time = twelve_hour or bool(minutes) or any(kind == 'elapsed' or code in 'hs' for _, kind, code in time_codes)
+
+    parts = []  # constant strings and functions of (the datetime, the seconds since EPOCH)
+    decimals = 0
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        code = text.lower()
+        if kind == 'point' and i + 1 < len(tokens) and tokens[i + 1] == ('digit', '0') and any(c == 's' for _, _, c in time_codes):
+            n = 0
+            while i + 1 < len(tokens) and tokens[i + 1] == ('digit', '0') and n < 3:
+                i, n = i + 1, n + 1
+            decimals = max(decimals, n)
+            parts.append(lambda d, seconds, n=n: '.' + f'{d.microsecond:06d}'[:n])
+        elif kind == 'date':
+            parts.append(date_part(code, i in minutes, twelve_hour))
+        elif kind == 'elapsed':
+            unit = {'h': 3600, 'm': 60, 's': 1}[code[0]]
+            parts.append(lambda d, seconds, unit=unit, width=len(code): f'{int(seconds // unit):0{width}d}')
+        elif kind == 'ampm':
+            parts.append(lambda d, seconds, choices=text.split('/'): choices[d.hour >= 12])
+        else:
+            parts.append(text)
+        i += 1
+
+    def render(value):
+        if isinstance(value, datetime.datetime):
+            d, seconds = value, (value - EPOCH).total_seconds()
+        elif isinstance(value, datetime.date):
+            d = datetime.datetime.combine(value, datetime.time())
+            seconds = (d - EPOCH).total_seconds()
+        elif isinstance(value, (datetime.time, datetime.timedelta)):
+            seconds = to_serial(value) * 86400
+            d = EPOCH + datetime.timedelta(seconds=seconds)
+        elif isinstance(value, (int, float, decimal.Decimal)) and 0 <= value < MAX_SERIAL:
+            seconds = float(value) * 86400
+            d = EPOCH + datetime.timedelta(seconds=seconds, days=value < 60)  # Excel counts a 29 Feb 1900, so the days before it are one off
+        else:
+            return format_general(value)
+        if has_time:  # rounded to the shown precision, so 0:59.9 shows as 1:00 (dates alone are truncated)
+            rounded = round(seconds, decimals)
+            d, seconds = d + datetime.timedelta(seconds=rounded - seconds), rounded
+        return ''.join(part if isinstance(part, str) else part(d, seconds) for part in parts)
+    return render
+
+
+def date_part(code: str, minute: bool, twelve_hour: bool):
+    """A function of (the datetime, the seconds since EPOCH) rendering a run of y, m, d, h or s"""
+    width = len(code)
+    if code[0] == 'y':
+        return (lambda d, seconds: f'{d.year % 100:02d}') if width <= 2 else (lambda d, seconds: f'{d.year:04d}')
+    if code[0] == 'm' and not minute:
+        if width <= 2:
+            return lambda d, seconds: f'{d.month:0{width}d}'
+        if width == 5:
+            return lambda d, seconds: static_values.MONTH_NAMES[d.month - 1][0]
+        return lambda d, seconds: static_values.MONTH_NAMES[d.month - 1][:3 if width == 3 else None]
+    if code[0] == 'd':
+        if width <= 2:
+            return lambda d, seconds: f'{d.day:0{width}d}'
+        return lambda d, seconds: static_values.DAY_NAMES[d.weekday()][:3 if width == 3 else None]
+    width = min(width, 2)
+    if code[0] == 'h':
+        if twelve_hour:
+            return lambda d, seconds: f'{d.hour % 12 or 12:0{width}d}'
+        return lambda d, seconds: f'{d.hour:0{width}d}'
+    if code[0] == 'm':
+        return lambda d, seconds: f'{d.minute:0{width}d}'
+    return lambda d, seconds: f'{d.second:0{width}d}'
+
+
+@functools.lru_cache(maxsize=static_values.NUMBER_FORMAT_CACHE_SIZE)
+def compile_format(format_code: str):
+    """
+    Compiles a number format into a function that renders a cell value (not None) the way Excel displays it.
+    Strings go through the text section (the fourth, or a lone section with an @) and are shown as they are
+    without one, booleans are shown as TRUE or FALSE, and dates are shown as numbers under a format without dates.
+
+    Arguments:
+    format_code: a number format, like cell.number_format
+
+    Returns:
+    a function of a cell value, returning a string
+    """
+    if format_code is None or format_code.lower() == 'general':
+        return format_general
+    sections = [compile_section(tokens) for tokens in split_sections(tokenize(format_code))]
+    text_section = None
+    if len(sections) > 3:
+        text_section = sections[3]
+    elif sections[-1].kind == 'text':
+        text_section = sections.pop()
+    sections = sections[:3]
+    conditional = any(section.condition is not None for section in sections)
+
+    def format_number(value):
+        if not sections:
+            return format_general(value)
+        if conditional:
+            section = next((section for section in sections if section.matches(value)), None)
+            if section is None:
+                return format_general(value)
+            sign = '-' if value < 0 and section.shows_sign() else ''
+        elif value < 0 and len(sections) > 1:
+            section, sign = sections[1], ''
+        elif value == 0 and len(sections) > 2:
+            section, sign = sections[2], ''
+        else:
+            section, sign = sections[0], '-' if value < 0 else ''
+        if section.kind == 'date':
+            return section.render(value)
+        return sign + section.render(abs(value))
+
+    def format_value(value):
+        if isinstance(value, str):
+            return value if text_section is None else text_section.render(value)
+        if isinstance(value, bool):
+            return format_general(value)
+        if isinstance(value, (int, float, decimal.Decimal)):
+            return format_number(value)
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time, datetime.timedelta)):
+            if sections and sections[0].kind == 'date':
+                return sections[0].render(value)
+            return format_number(to_serial(value))
+        return format_general(value)
+    return format_value
+
+
+def format_value(value, format_code: str):
+    """Renders a cell value under a number format, see compile_format"""
+    if value is None:
+        return ''
+    return compile_format(format_code)(value)
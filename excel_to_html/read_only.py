@@ -0,0 +1,286 @@
+import itertools
+import openpyxl
+from openpyxl.cell.read_only import ReadOnlyCell, EMPTY_CELL
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.styles.borders import Border
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.units import DEFAULT_COLUMN_WIDTH
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.dimensions import SheetFormatProperties
+from openpyxl.worksheet.hyperlink import Hyperlink
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+from typing import Dict
+
+
+COL_TAG = f'{{{SHEET_MAIN_NS}}}col'
+ROW_TAG = f'{{{SHEET_MAIN_NS}}}row'
+CELL_TAG = f'{{{SHEET_MAIN_NS}}}c'
+FORMAT_TAG = f'{{{SHEET_MAIN_NS}}}sheetFormatPr'
+MERGE_TAG = f'{{{SHEET_MAIN_NS}}}mergeCell'
+HYPERLINK_TAG = f'{{{SHEET_MAIN_NS}}}hyperlink'
+DIGITS = '0123456789'
+
+
+class SheetCell:
+    """
+    A stand-in for an openpyxl Cell, built from a cell of a read-only worksheet. It has the
+    attributes ParsedCell reads, with the styles looked up from the workbook only when asked for.
+    """
+    __slots__ = ('row', 'column', 'value', 'style_id', 'hyperlink', '_workbook')
+
+    def __init__(self, workbook, row: int, column: int, value, style_id: int, hyperlink=None):
+        self._workbook = workbook
+        self.row = row
+        self.column = column
+        self.value = value
+        self.style_id = style_id
+        self.hyperlink = hyperlink
+
+    @property
+    def _style(self):
+        return self._workbook._cell_styles[self.style_id]
+
+    @property
+    def font(self):
+        return self._workbook._fonts[self._style.fontId]
+
+    @property
+    def fill(self):
+        return self._workbook._fills[self._style.fillId]
+
+    @property
+    def border(self):
+        return self._workbook._borders[self._style.borderId]
+
+    @property
+    def alignment(self):
+        return self._workbook._alignments[self._style.alignmentId]
+
+    @property
+    def number_format(self):
+        num_fmt_id = self._style.numFmtId
+        if num_fmt_id < BUILTIN_FORMATS_MAX_SIZE:
+            return BUILTIN_FORMATS.get(num_fmt_id, 'General')
+        return self._workbook._number_formats[num_fmt_id - BUILTIN_FORMATS_MAX_SIZE]
+
+
+def read_sheet_layout(ws, source=None):
+    """
+    A read-only worksheet only streams cells, so this reads everything else main needs
+    (merged cells, column widths, row heights, the default sizes and hyperlinks) straight from the sheet's XML.
+    The cells themselves are skipped, so this is cheap compared to parsing them, but their tags are counted for the
+    sheet's dimensions: the <dimension> element a read-only worksheet goes by is optional and can be out of date.
+
+    Arguments:
+    ws: an openpyxl read-only worksheet
+    source: the sheet's XML as a file-like object, if not the one in the workbook (see xml_engine.read_sheet_layout)
+
+    Returns:
+    a dictionary with the same information load_sheet takes from a regular worksheet
+    """
+    layout = {
+        'merged_cell_ranges': [],
+        'column_widths': {},  # excel units, keyed by column letter
+        'row_heights': {},  # points, keyed by 1-based row
+        'sheet_format': SheetFormatProperties(),
+        'hyperlinks': {},  # keyed by 1-based (row, column)
+        'dimensions': (0, 0),  # the last row and column with a cell, like ws.calculate_dimension(force=True) after ws.reset_dimensions()
+    }
+    hyperlinks = []
+    row_counter = col_counter = max_row = max_col = 0
+    with source or ws._get_source() as src:
+        for event, element in iterparse(src, events=('start', 'end')):
+            tag = element.tag
+            if event == 'end':
+                if tag == ROW_TAG:
+                    element.clear()  # drops the cells
+                continue
+            if tag == ROW_TAG:
+                # mirrors openpyxl.worksheet._reader.WorkSheetParser.parse_row
+                row_counter = int(float(element.get('r', row_counter + 1)))
+                keys = {k for k in element.attrib if not k.startswith('{')}
+                if keys - {'r', 'spans'}:
+                    height = element.get('ht')
+                    layout['row_heights'][row_counter] = None if height is None else float(height)
+                col_counter = 0
+            elif tag == CELL_TAG:
+                coordinate = element.get('r')
+                col_counter = col_counter + 1 if coordinate is None else column_index_from_string(coordinate.rstrip(DIGITS))
+                max_row, max_col = row_counter, max(max_col, col_counter)
+            elif tag == COL_TAG:
+                column = openpyxl.utils.get_column_letter(int(element.get('min')))
+                layout['column_widths'][column] = float(element.get('width', DEFAULT_COLUMN_WIDTH))
+            elif tag == FORMAT_TAG:
+                layout['sheet_format'] = SheetFormatProperties.from_tree(element)
+            elif tag == MERGE_TAG:
+                layout['merged_cell_ranges'].append(CellRange(element.get('ref')))
+            elif tag == HYPERLINK_TAG:
+                hyperlinks.append(Hyperlink.from_tree(element))
+    layout['dimensions'] = (max_row, max_col)
+
+    if hyperlinks:
+        rels_path = get_rels_path(ws._worksheet_path)
+        rels = get_dependents(ws.parent._archive, rels_path) if rels_path in ws.parent._archive.namelist() else None
+        for link in hyperlinks:
+            if link.id and rels is not None:
+                link.target = rels.get(link.id).Target
+            min_col, min_row, max_col, max_row = openpyxl.utils.cell.range_boundaries(link.ref)
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    layout['hyperlinks'][(row, col)] = link
+    return layout
+
+
+def read_merge_style_ids(ws, merged_cell_ranges):
+    """
+    When loading a regular worksheet, openpyxl gives the top-left cell of each merge the right and bottom
+    borders of the merge's bottom-right cell (see openpyxl.worksheet.merge.MergedCellRange). This does the same
+    for a read-only worksheet, reading the style ids of both corners from the sheet's XML. The scan stops after
+    the last bottom-right corner, which is usually near the top of the sheet.
+
+    Arguments:
+    ws: an openpyxl read-only worksheet
+    merged_cell_ranges: the merged ranges of the worksheet, from read_sheet_layout
+
+    Returns:
+    a dictionary mapping the 1-based (row, column) of each affected top-left cell to the style id it should use
+    """
+    corners = merge_corners(merged_cell_ranges)
+    if not corners:
+        return {}
+    last_row = max(row for row, _ in corners)
+
+    corner_styles = {}  # only corners that exist in the file
+    row_counter = col_counter = 0
+    with ws._get_source() as src:
+        for event, element in iterparse(src, events=('start', 'end')):
+            tag = element.tag
+            if event == 'end':
+                if tag == ROW_TAG:
+                    element.clear()
+                continue
+            if tag == ROW_TAG:
+                row_counter = int(float(element.get('r', row_counter + 1)))
+                col_counter = 0
+                if row_counter > last_row:
+                    break
+            elif tag == CELL_TAG:
+                coordinate = element.get('r')
+                if coordinate is None:
+                    col_counter += 1
+                else:
+                    row_counter, col_counter = openpyxl.utils.cell.coordinate_to_tuple(coordinate)
+                if (row_counter, col_counter) in corners:
+                    corner_styles[(row_counter, col_counter)] = int(element.get('s', 0))
+    return merge_style_ids_from_corners(ws.parent, merged_cell_ranges, corner_styles)
+
+
+def merge_corners(merged_cell_ranges):
+    """The 1-based (row, column) of the top-left and bottom-right cell of every merge"""
+    corners = set()
+    for merge_range in merged_cell_ranges:
+        corners.add((merge_range.min_row, merge_range.min_col))
+        corners.add((merge_range.max_row, merge_range.max_col))
+    return corners
+
+
+def merge_style_ids_from_corners(wb, merged_cell_ranges, corner_styles: Dict):
+    """
+    The second half of read_merge_style_ids.
+
+    Arguments:
+    wb: an openpyxl read-only workbook
+    merged_cell_ranges: the merged ranges of the worksheet, from read_sheet_layout
+    corner_styles: the style id of each corner that exists in the file, keyed by its 1-based (row, column)
+    """
+    merge_style_ids = {}
+    for merge_range in merged_cell_ranges:
+        start = (merge_range.min_row, merge_range.min_col)
+        end = (merge_range.max_row, merge_range.max_col)
+        if end not in corner_styles:
+            continue
+        start_style = StyleArray(wb._cell_styles[corner_styles[start]]) if start in corner_styles else StyleArray()
+        end_border = wb._borders[wb._cell_styles[corner_styles[end]].borderId]
+        start_border = wb._borders[start_style.borderId] + Border(right=end_border.right, bottom=end_border.bottom)
+        start_style.borderId = wb._borders.add(start_border)
+        merge_style_ids[start] = wb._cell_styles.add(start_style)
+    return merge_style_ids
+
+
+def iter_sheet_cells(
+    ws,
+    ws_meta: Dict,
+    min_row: int=None,
+    max_row: int=None,
+    min_col: int=None,
+    max_col: int=None,
+    iter_rows=None,
+    merge_style_ids: Dict=None
+):
+    """
+    The read-only counterpart of main.iter_sheet_cells. A read-only worksheet has no MergedCells and
+    cannot jump back to a cell it has already streamed past, so the cells hidden by a merge are found with
+    the merged ranges from read_sheet_layout, and the top-left cells of merges clipped by the window are
+    picked up on the way (they always come before the first visible cell of their merge).
+
+    Arguments:
+    ws: an openpyxl read-only worksheet
+    ws_meta: A dictionary containing global values for the worksheet, from load_sheet
+    min_row, max_row, min_col, max_col: the view window, see main
+    iter_rows: a replacement for ws.iter_rows, whose cells are None or a tuple of (value, style_id), see xml_engine.iter_rows
+    merge_style_ids: a replacement for read_merge_style_ids, see xml_engine.read_merge_style_ids
+
+    Returns:
+    a generator of rows, see main.iter_sheet_cells
+    """
+    wb = ws.parent
+    empty_style_id = wb._cell_styles.add(StyleArray())  # the style a missing cell gets in a regular worksheet
+    hyperlinks = ws_meta['hyperlinks']
+    clipped_merges = ws_meta['clipped_merges']
+    parents = set(clipped_merges.values())
+    if merge_style_ids is None:
+        merge_style_ids = read_merge_style_ids(ws, ws_meta['merged_cell_ranges'])
+    hidden = set()
+    for merge_range in ws_meta['merged_cell_ranges']:
+        min_c, min_r, max_c, max_r = merge_range.bounds
+        for r in range(max(min_r, ws_meta['min_row']), min(max_r, ws_meta['max_row']) + 1):
+            for c in range(max(min_c, ws_meta['min_col']), min(max_c, ws_meta['max_col']) + 1):
+                if (r, c) != (min_r, min_c):
+                    hidden.add((r, c))
+
+    window_row, window_col = min_row or 1, min_col or 1
+    first_row = min([window_row] + [r for r, _ in parents])
+    first_col = min([window_col] + [c for _, c in parents])
+    rows = (iter_rows or ws.iter_rows)(min_row=first_row, max_row=max_row, min_col=first_col, max_col=max_col)
+    if max_row is not None:  # a regular worksheet makes up the missing rows at the bottom, a read-only one stops at the last row in the file
+        empty_row = (EMPTY_CELL,) * ((max_col or ws.max_column) - first_col + 1)
+        rows = itertools.chain(rows, itertools.repeat(empty_row))
+        rows = itertools.islice(rows, max(max_row - first_row + 1, 0))
+
+    parent_cells = {}
+    for r, row in enumerate(rows, first_row):
+        cells = []
+        for c, cell in enumerate(row, first_col):
+            if isinstance(cell, ReadOnlyCell):
+                style_id = merge_style_ids.get((r, c), cell._style_id)
+                sheet_cell = SheetCell(wb, r, c, cell.value, style_id, hyperlinks.get((r, c)))
+            elif isinstance(cell, tuple):
+                style_id = merge_style_ids.get((r, c), cell[1])
+                sheet_cell = SheetCell(wb, r, c, cell[0], style_id, hyperlinks.get((r, c)))
+            else:
+                style_id = merge_style_ids.get((r, c), empty_style_id)
+                sheet_cell = SheetCell(wb, r, c, None, style_id, hyperlinks.get((r, c)))
+            if (r, c) in parents:
+                parent_cells[(r, c)] = sheet_cell
+            if r < window_row or c < window_col:
+                continue
+            if (r, c) in hidden:
+                parent = clipped_merges.get((r, c))
+                cells.append(None if parent is None else parent_cells[parent])
+            else:
+                cells.append(sheet_cell)
+        if r >= window_row:
+            yield cells
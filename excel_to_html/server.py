@@ -0,0 +1,470 @@
+"""
+A long-running conversion server, started with `excel-to-html serve`. It keeps a pool of worker processes that have
+already imported openpyxl and jinja2 and compiled the templates (see main.warmup), so a request only pays for its own
+conversion. Each worker also keeps its most recently used workbooks loaded, together with their style tables and
+sheet layouts, so converting another window or sheet of a workbook it has seen skips loading it again.
+
+The server speaks HTTP, over TCP or a Unix socket:
+    POST /convert with a JSON body of main's arguments and the path of the workbook, like
+        {"path": "report.xlsx", "sheetname": "Sheet1", "max_row": 20, "style_mode": "compact"}
+    POST /convert?sheetname=Sheet1&max_row=20 with the workbook itself as the body (an upload)
+    GET /metrics for the queue depth, the latencies and the workbook cache hits, as JSON
+"""
+try:
+    import static_values
+    from budget import Budget, BudgetExceeded
+    from main import check_budget_before_loading, check_style_mode, load_workbook, load_sheet, needs_budget_check, render_sheet, warmup
+except ModuleNotFoundError:
+    from . import static_values
+    from .budget import Budget, BudgetExceeded
+    from .main import check_budget_before_loading, check_style_mode, load_workbook, load_sheet, needs_budget_check, render_sheet, warmup
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import hashlib
+import http.server
+import io
+import json
+import os
+import signal
+import socketserver
+import stat
+import sys
+import threading
+import time
+import urllib.parse
+import zipfile
+from typing import Dict, List
+
+
+ARGUMENTS = {  # the arguments a request can have, and their types, see parse_request
+    'path': str,
+    'sheetname': str,
+    'min_row': int,
+    'max_row': int,
+    'min_col': int,
+    'max_col': int,
+    'openpyxl_kwargs': dict,
+    'style_mode': str,
+    'engine': str,
+    'trim': bool,
+    'collapse_blank_rows': int,
+    'format_values': bool,
+    'max_cells': int,
+    'max_memory': int,
+}
+BOOLEANS = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False, '': False}
+worker_workbooks = collections.OrderedDict()  # the workbooks loaded by this worker process, see get_workbook
+
+
+def parse_query(query: str):
+    """
+    Reads the arguments of a request from a query string, as strings, see parse_request.
+
+    Returns:
+    a dictionary of arguments
+    """
+    return {name: values[-1] for name, values in urllib.parse.parse_qs(query, keep_blank_values=True).items()}
+
+
+def parse_value(name: str, value):
+    """
+    Converts the value of an argument to its type in ARGUMENTS. Strings (from a query string, or quoted in JSON) are
+    parsed, openpyxl_kwargs as a JSON object. None stays None.
+
+    Raises:
+    a ValueError if the value is not of the argument's type and cannot be parsed as one
+    """
+    kind = ARGUMENTS[name]
+    if value is None or (isinstance(value, kind) and not (kind is int and isinstance(value, bool))):
+        return value
+    if isinstance(value, str):
+        if kind is bool and value.lower() in BOOLEANS:
+            return BOOLEANS[value.lower()]
+        if kind is int and value.strip().lstrip('+-').isdigit():
+            return int(value)
+        if kind is dict:
+            parsed = json.loads(value)
+            if isinstance(parsed, dict):
+                return parsed
+    raise ValueError(f'{name} must be {kind.__name__}, not {value!r}')
+
+
+def parse_request(request: Dict):
+    """
+    Checks the arguments of a request and converts them to their types, see parse_value.
+
+    Returns:
+    the request, with its values converted
+
+    Raises:
+    a ValueError if a request has unknown or mistyped arguments, or a style_mode or engine main would not accept
+    """
+    unknown = set(request) - set(ARGUMENTS)
+    if unknown:
+        raise ValueError(f'unknown arguments {sorted(unknown)}')
+    request = {name: parse_value(name, value) for name, value in request.items()}
+    check_style_mode(request.get('style_mode') or 'inline')
+    if (request.get('engine') or 'openpyxl') not in static_values.ENGINES:
+        raise ValueError(f"engine must be one of {static_values.ENGINES}, not {request['engine']!r}")
+    return request
+
+
+def workbook_key(source, openpyxl_kwargs: Dict, engine: str):
+    """
+    The key of a loaded workbook in worker_workbooks. A path is keyed by its modification time and size as well,
+    so a workbook that changed on disk is loaded again, and an upload by a hash of its contents.
+    """
+    if isinstance(source, bytes):
+        identity = ('upload', hashlib.sha256(source).hexdigest())
+    else:
+        stat = os.stat(source)
+        identity = ('path', os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+    return identity + (json.dumps(openpyxl_kwargs or {}, sort_keys=True, default=repr), engine)
+
+
+def close_workbook(wb, wb_meta: Dict):
+    if wb_meta['read_only']:  # read-only workbooks keep the file open until closed
+        wb.close()
+
+
+def get_workbook(source, openpyxl_kwargs: Dict, engine: str, cache_size: int, check=None):
+    """
+    Loads a workbook, or reuses it if this worker loaded it recently. Reusing it also reuses its style table and the
+    layouts of its sheets (see main.load_workbook), which are kept in wb_meta. At most cache_size workbooks are kept,
+    the least recently used one is dropped first.
+
+    Arguments:
+    source: the path of the workbook, or its contents
+    openpyxl_kwargs, engine: see main.main
+    cache_size: how many workbooks this worker keeps loaded
+    check: an optional function of the workbook's source (a path or a file-like object), called before loading it
+
+    Returns:
+    the openpyxl workbook, its wb_meta and whether it was already loaded
+    """
+    key = workbook_key(source, openpyxl_kwargs, engine)
+    loaded = worker_workbooks.get(key)
+    if loaded is not None:
+        worker_workbooks.move_to_end(key)
+        return loaded + (True,)
+    if check is not None:
+        check(io.BytesIO(source) if isinstance(source, bytes) else source)
+    wb, wb_meta = load_workbook(io.BytesIO(source) if isinstance(source, bytes) else source, openpyxl_kwargs, engine=engine)
+    worker_workbooks[key] = (wb, wb_meta)
+    while len(worker_workbooks) > cache_size:
+        close_workbook(*worker_workbooks.popitem(last=False)[1])
+    return wb, wb_meta, False
+
+
+def convert_request(source, request: Dict, cache_size: int):
+    """
+    Converts a request in a worker process, the same way main.main would.
+
+    Arguments:
+    source: the path of the workbook, or its contents
+    request: the arguments of the request, see ARGUMENTS (path is ignored)
+    cache_size: see get_workbook
+
+    Returns:
+    a tuple of what main.main returns, whether the workbook was already loaded and the time taken in seconds
+    """
+    start = time.perf_counter()
+    openpyxl_kwargs, engine = request.get('openpyxl_kwargs'), request.get('engine') or 'openpyxl'
+    sheetname = request.get('sheetname') or 'Sheet1'
+    bounds = tuple(request.get(k) for k in ('min_row', 'max_row', 'min_col', 'max_col'))
+    budget = check = None
+    if request.get('max_cells') is not None or request.get('max_memory') is not None:
+        budget = Budget(request.get('max_cells'), request.get('max_memory'))
+    if needs_budget_check(openpyxl_kwargs, engine, budget):
+        def check(workbook):
+            check_budget_before_loading(workbook, openpyxl_kwargs, [(sheetname, *bounds)], request.get('trim', False), budget)
+    wb, wb_meta, cached = get_workbook(source, openpyxl_kwargs, engine, cache_size, check)
+    ws, ws_meta = load_sheet(
+        wb, wb_meta, sheetname, *bounds,
+        request.get('trim', False), request.get('collapse_blank_rows'), budget, request.get('format_values', False),
+    )
+    result = render_sheet(ws, ws_meta, *bounds, style_mode=request.get('style_mode') or 'inline')
+    return result, cached, time.perf_counter() - start
+
+
+def summarize(times: List[float]):
+    """The count, mean, median, 95th and 99th percentiles and maximum of some times, in seconds"""
+    if not times:
+        return {'count': 0}
+    times = sorted(times)
+
+    def percentile(p):
+        return times[min(int(len(times) * p), len(times) - 1)]
+    return {
+        'count': len(times),
+        'mean': sum(times) / len(times),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': times[-1],
+    }
+
+
+class ConversionServer:
+    """
+    Runs conversions on a pool of pre-warmed worker processes and keeps the metrics served at /metrics.
+    A request can go to any worker, so each worker keeps its own cache of loaded workbooks. If a worker dies (killed for
+    running out of memory, say), the pool is replaced with a new, warmed up one.
+    """
+
+    def __init__(
+        self,
+        jobs: int=None,
+        cache_size: int=static_values.SERVER_WORKBOOK_CACHE_SIZE,
+        max_upload: int=static_values.SERVER_MAX_UPLOAD_BYTES
+    ):
+        """
+        Arguments:
+        jobs: the number of worker processes (default: one per core)
+        cache_size: how many workbooks each worker keeps loaded, see get_workbook
+        max_upload: the largest workbook that can be uploaded, in bytes
+        """
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.max_upload = max_upload
+        self.pool = None
+        self.pool_lock = threading.Lock()  # held while the pool is replaced
+        self.lock = threading.Lock()
+        self.in_flight = 0  # submitted to the pool and not finished yet
+        self.completed = 0
+        self.failed = 0
+        self.workbook_hits = 0
+        self.workbook_misses = 0
+        self.worker_restarts = 0
+        self.latencies = collections.deque(maxlen=static_values.SERVER_LATENCY_WINDOW)  # from receiving a request to answering it
+        self.convert_times = collections.deque(maxlen=static_values.SERVER_LATENCY_WINDOW)  # spent converting, in the worker
+
+    def start(self):
+        """Starts the worker processes, each importing and compiling everything before taking a request"""
+        warmup()  # so forked workers start warm, and the others warm up in their initializer
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, initializer=warmup)
+        for future in [pool.submit(warmup) for _ in range(self.jobs)]:
+            future.result()
+        return pool
+
+    def restart_pool(self, broken):
+        """Replaces a pool that lost a worker, unless another request already replaced it"""
+        with self.pool_lock:
+            if self.pool is not broken:
+                return
+            broken.shutdown(wait=False)
+            self.pool = self.start_pool()
+        with self.lock:
+            self.worker_restarts += 1
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def convert(self, source, request: Dict):
+        """
+        Converts a request on the pool, waiting for a free worker.
+
+        Arguments:
+        source: the path of the workbook, or its contents
+        request: the arguments of the request, see ARGUMENTS
+
+        Returns:
+        what main.main returns and whether the worker already had the workbook loaded
+
+        Raises:
+        a ValueError for a bad request (see parse_request), concurrent.futures.process.BrokenProcessPool if its worker
+        died (the pool is replaced then, so the next request runs again), or whatever main.main raised
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            request = parse_request(request)
+            pool = self.pool
+            try:
+                result, cached, convert_time = pool.submit(convert_request, source, request, self.cache_size).result()
+            except concurrent.futures.process.BrokenProcessPool:
+                self.restart_pool(pool)
+                raise
+        except BaseException:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        with self.lock:
+            self.completed += 1
+            if cached:
+                self.workbook_hits += 1
+            else:
+                self.workbook_misses += 1
+            self.latencies.append(time.perf_counter() - start)
+            self.convert_times.append(convert_time)
+        return result, cached
+
+    def metrics(self):
+        """
+        Returns:
+        a dictionary of the number of workers, the queue depth (requests waiting for a worker), the requests in flight,
+        completed and failed, the workbook cache hits and misses, the times the pool was replaced, and summaries of the latencies and of the time spent
+        converting over the last static_values.SERVER_LATENCY_WINDOW requests
+        """
+        with self.lock:
+            return {
+                'workers': self.jobs,
+                'queue_depth': max(self.in_flight - self.jobs, 0),
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'workbook_cache_hits': self.workbook_hits,
+                'workbook_cache_misses': self.workbook_misses,
+                'worker_restarts': self.worker_restarts,
+                'latency': summarize(list(self.latencies)),
+                'convert_time': summarize(list(self.convert_times)),
+            }
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /convert and /metrics for the ConversionServer in self.server.converter, see the module docstring"""
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix socket'
+
+    def send_body(self, status: int, body: str, content_type: str='text/plain; charset=utf-8', headers: Dict=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != '/metrics':
+            return self.send_body(404, 'Not found\n')
+        self.send_body(200, json.dumps(self.server.converter.metrics()), 'application/json')
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/convert':
+            return self.send_body(404, 'Not found\n')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            return self.send_body(400, 'Bad Content-Length\n')
+        if length > self.server.converter.max_upload:
+            self.close_connection = True  # the body is left unread
+            return self.send_body(413, f'The body is larger than the {self.server.converter.max_upload} bytes allowed\n')
+        try:
+            body = self.rfile.read(length)
+            if self.headers.get_content_type() == 'application/json':
+                request = json.loads(body)
+                if not isinstance(request, dict):
+                    raise ValueError('the body must be a JSON object of arguments')
+            else:
+                request = parse_query(url.query)
+            request = parse_request(request)
+            if body and self.headers.get_content_type() != 'application/json':
+                source = body
+            elif request.get('path'):
+                source = request['path']
+            else:
+                raise ValueError('send a path or the workbook as the body')
+            result, cached = self.server.converter.convert(source, request)
+        except FileNotFoundError as e:
+            return self.send_body(404, f'{type(e).__name__}: {e}\n')
+        except BudgetExceeded as e:
+            return self.send_body(413, f'{type(e).__name__}: {e}\n')
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:  # bad arguments, a missing sheet or a broken workbook
+            return self.send_body(400, f'{type(e).__name__}: {e}\n')
+        except concurrent.futures.process.BrokenProcessPool as e:  # its worker died, and the pool was replaced
+            return self.send_body(503, f'{type(e).__name__}: {e}\n')
+        except Exception as e:
+            return self.send_body(500, f'{type(e).__name__}: {e}\n')
+        headers = {'X-Workbook-Cache': 'hit' if cached else 'miss'}
+        if request.get('style_mode') == 'separate':
+            html, css = result
+            return self.send_body(200, json.dumps({'html': html, 'css': css}), 'application/json', headers)
+        self.send_body(200, result, 'text/html; charset=utf-8', headers)
+
+
+class TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def is_socket(path: str):
+    """Whether there is a socket at path"""
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def make_server(converter: ConversionServer, host: str='127.0.0.1', port: int=static_values.SERVER_PORT, unix_socket: str=None):
+    """
+    Builds the HTTP server answering requests with converter, listening on host and port or on unix_socket.
+    A stale socket file left by a previous server is replaced.
+
+    Returns:
+    a socketserver server, call its serve_forever method to start answering
+
+    Raises:
+    a FileExistsError if something other than a socket is at unix_socket, which is never removed
+    """
+    if unix_socket is None:
+        httpd = TCPServer((host, port), RequestHandler)
+    else:
+        if is_socket(unix_socket):
+            os.remove(unix_socket)
+        elif os.path.lexists(unix_socket):
+            raise FileExistsError(f'{unix_socket} exists and is not a socket')
+        httpd = UnixServer(unix_socket, RequestHandler)
+    httpd.converter = converter
+    return httpd
+
+
+def serve(
+    host: str='127.0.0.1',
+    port: int=static_values.SERVER_PORT,
+    unix_socket: str=None,
+    jobs: int=None,
+    cache_size: int=static_values.SERVER_WORKBOOK_CACHE_SIZE,
+    max_upload: int=static_values.SERVER_MAX_UPLOAD_BYTES
+):
+    """
+    Runs the conversion server until interrupted, see the module docstring.
+
+    Arguments:
+    host, port: the address to listen on
+    unix_socket: the path of a Unix socket to listen on instead
+    jobs, cache_size, max_upload: see ConversionServer
+    """
+    converter = ConversionServer(jobs, cache_size, max_upload)
+    httpd = make_server(converter, host, port, unix_socket)  # before starting the workers, in case the address is taken
+    converter.start()
+    address = unix_socket or f'http://{host}:{httpd.server_address[1]}'
+    print(f'Serving on {address} with {converter.jobs} worker(s)', file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # shut down cleanly when stopped by a service manager too
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        converter.close()
+        if unix_socket is not None and is_socket(unix_socket):
+            os.remove(unix_socket)
@@ -14,6 +14,9 @@ COLOR_INDEX = (
     '00993300', '00993366', '00333399', '00333333',  #60-63
 )
 #  indices 64 and 65 are reserved for the system foreground and background colours respectively
+INDEXED_COLORS = tuple('#' + color[2:] for color in COLOR_INDEX)  # COLOR_INDEX as hex-colors, with and without the alpha channel
+INDEXED_COLORS_ALPHA = tuple('#' + color for color in COLOR_INDEX)
+COLOR_CACHE_SIZE = 4096  # distinct colors kept by color_utilities.resolve_color
 border_style_to_width = {
     'dashDot': '1px',
     'dashed': '1px',
@@ -46,3 +49,20 @@ border_style_to_style = {
 }
 DEFAULT_BORDER = '1px solid #D9D9D9'
 BORDER_SIDES = ['top', 'right', 'bottom', 'left']
+SIDE_BITS = {side: 1 << i for i, side in enumerate(BORDER_SIDES)}  # for keeping a set of sides in an int
+ALL_SIDES = sum(SIDE_BITS.values())
+STYLE_MODES = ('inline', 'class', 'separate', 'compact')
+INHERITED_STYLES = ('font-family', 'font-size', 'font-style', 'font-weight', 'color', 'text-align', 'vertical-align')  # the cell styles a <td> inherits from its <tr> (vertical-align through the browsers' default stylesheet)
+ENGINES = ('openpyxl', 'xml')
+NUMBER_FORMAT_CACHE_SIZE = 1024  # distinct number formats kept compiled by number_formats.compile_format
+MONTH_NAMES = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December')
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')  # in datetime.weekday order
+CSS_CLASS_PREFIX = 'xl'  # generated class names are xl0, xl1, ...
+BUDGET_BYTES_PER_CELL = 1024  # rough costs of a conversion, see budget.Budget.estimate_memory
+BUDGET_BYTES_PER_MERGE = 512
+CACHE_MAX_BYTES = 1 << 30  # the default size of a cache.HTMLCache
+SERVER_PORT = 8765  # the defaults of server.serve
+SERVER_WORKBOOK_CACHE_SIZE = 8  # workbooks each worker keeps loaded
+SERVER_LATENCY_WINDOW = 1000  # the requests the latencies at /metrics are computed over
+SERVER_MAX_UPLOAD_BYTES = 100 * (1 << 20)  # the largest request body server.ConversionServer accepts
+VERSION = '1.0.0'  # setup.py reads it from here
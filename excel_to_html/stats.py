@@ -0,0 +1,93 @@
+import contextlib
+import time
+try:
+    import color_utilities
+except ModuleNotFoundError:
+    from . import color_utilities
+from typing import Iterable
+
+
+PHASES = ['load_workbook', 'theme_colors', 'load_sheet', 'read_cells', 'parse_cells', 'fix_borders', 'render', 'write']
+
+
+class ConversionStats:
+    """
+    Collects the wall time spent in each phase of a conversion and a few counters. Pass one as stats to
+    main, iter_html or convert_many; when it is left out nothing is measured. The phases are timed exclusively: since
+    the rows are streamed through the phases, time is charged to whichever phase is running at the moment.
+
+    Phases (see PHASES): load_workbook, theme_colors, load_sheet, read_cells, parse_cells, fix_borders, render and
+        write (writing to out, or joining the output)
+    Counters: cells (ParsedCells made), rows, merged_ranges, distinct_styles (in the workbook's style table),
+        color_conversions (rgb/theme colors converted), color_cache_hits and color_cache_misses (of
+        color_utilities.resolve_color, the color counters are process-wide), output_bytes (utf-8) and peak_memory
+        (the highest budget.Budget.peak_memory, only measured with a budget)
+    """
+
+    def __init__(self):
+        self.times = {phase: 0.0 for phase in PHASES}
+        self.counts = {'cells': 0, 'rows': 0, 'merged_ranges': 0, 'distinct_styles': 0, 'color_conversions': 0, 'color_cache_hits': 0, 'color_cache_misses': 0, 'output_bytes': 0, 'peak_memory': 0}
+        self._phase = None
+        self._since = None
+        self._color_counts = self.color_counts()
+
+    def enter(self, phase: str):
+        """
+        Charges the time since the last switch to the running phase and starts timing phase instead.
+
+        Returns:
+        the phase that was running, to hand back to enter once phase is done
+        """
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.times[self._phase] += now - self._since
+        previous, self._phase, self._since = self._phase, phase, now
+        return previous
+
+    @contextlib.contextmanager
+    def timed(self, phase: str):
+        previous = self.enter(phase)
+        try:
+            yield
+        finally:
+            self.enter(previous)
+
+    def iter_timed(self, iterable: Iterable, phase: str):
+        """Wraps a generator so the time spent producing each item is charged to phase"""
+        iterator = iter(iterable)
+        while True:
+            previous = self.enter(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.enter(previous)
+            yield item
+
+    @staticmethod
+    def color_counts():
+        cache_info = color_utilities.resolve_color.cache_info()
+        return {
+            'color_conversions': color_utilities.conversion_count,
+            'color_cache_hits': cache_info.hits,
+            'color_cache_misses': cache_info.misses,
+        }
+
+    def as_dict(self):
+        """
+        Returns:
+        a flat dictionary of the counters, the seconds taken by each phase (as time_<phase>) and their total (time_total)
+        """
+        self.counts.update({k: v - self._color_counts[k] for k, v in self.color_counts().items()})
+        ret = dict(self.counts)
+        ret.update({f'time_{phase}': seconds for phase, seconds in self.times.items()})
+        ret['time_total'] = sum(self.times.values())
+        return ret
+
+
+def timed(stats: ConversionStats, phase: str):
+    """stats.timed(phase), or a context manager that does nothing when stats is None"""
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.timed(phase)
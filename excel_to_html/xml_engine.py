@@ -0,0 +1,255 @@
+"""
+The 'xml' engine (see main.main) reads the cells of a sheet straight from its XML, instead of going through
+openpyxl's worksheet and cell objects. The workbook is still opened with openpyxl in read-only mode, which only parses
+the workbook-wide parts (styles.xml, sharedStrings.xml, the theme), and the cells are handed to read_only.iter_sheet_cells
+as (value, style_id) pairs, so everything after reading the cells is shared with the other engines.
+"""
+from . import read_only
+import io
+import re
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.worksheet._reader import WorkSheetParser, _cast_number
+from openpyxl.utils.datetime import from_ISO8601
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+
+
+VALUE_TAG = f'{{{SHEET_MAIN_NS}}}v'
+FORMULA_TAG = f'{{{SHEET_MAIN_NS}}}f'
+INLINE_STRING_TAG = f'{{{SHEET_MAIN_NS}}}is'
+TEXT_TAG = f'{{{SHEET_MAIN_NS}}}t'
+SHEET_DATA_START = re.compile(rb'<((?:\w+:)?)sheetData\b[^>]*?(/?)>')
+ROW_START = re.compile(rb'<(?:\w+:)?row\b([^>]*)>')
+CELL_START = re.compile(rb'<(?:\w+:)?c\b([^>]*)>')
+ATTRIBUTE = re.compile(rb'([\w:]+)\s*=\s*(["\'])(.*?)\2')  # XML allows either quote around a value
+ROW_OR_CELL_START = re.compile(rb'<(?:\w+:)?(row|c)\b([^>]*?)(/?)>')
+R_ATTRIBUTE = re.compile(rb'\sr\s*=\s*(["\'])(.*?)\1')
+S_ATTRIBUTE = re.compile(rb'\ss\s*=\s*(["\'])(.*?)\1')
+DIGITS = '0123456789'
+
+
+def read_sheet_xml(ws):
+    """The raw XML of a read-only worksheet"""
+    return ws.parent._archive.read(ws._worksheet_path)
+
+
+def split_sheet_data(data: bytes):
+    """
+    Splits the XML of a sheet around its <sheetData>, the part that holds the rows.
+
+    Returns:
+    the XML without the sheetData (still a valid document), and the XML of the rows
+    """
+    match = SHEET_DATA_START.search(data)
+    if match is None:
+        return data, b''
+    if match.group(2):  # <sheetData/>
+        return data[:match.start()] + data[match.end():], b''
+    end_tag = b'</' + match.group(1) + b'sheetData>'
+    end = data.index(end_tag, match.end())
+    return data[:match.start()] + data[end + len(end_tag):], data[match.end():end]
+
+
+def row_attributes(attributes: bytes):
+    """The unprefixed attributes of a tag, as a dictionary of strings (prefixed ones are namespaced, see read_only.read_sheet_layout)"""
+    return {k.decode(): v.decode() for k, _, v in ATTRIBUTE.findall(attributes) if b':' not in k}
+
+
+def read_sheet_layout(ws, data: bytes):
+    """
+    read_only.read_sheet_layout for the xml engine. The rows are skipped with a regular expression rather than being parsed,
+    only their heights are read off the <row> tags, and the <c> tags are counted for the dimensions.
+
+    Arguments:
+    ws: an openpyxl read-only worksheet
+    data: the sheet's XML, from read_sheet_xml
+
+    Returns:
+    the same dictionary as read_only.read_sheet_layout
+    """
+    without_rows, rows = split_sheet_data(data)
+    layout = read_only.read_sheet_layout(ws, io.BytesIO(without_rows))
+    row_counter = col_counter = max_row = max_col = 0
+    for match in ROW_OR_CELL_START.finditer(rows):
+        if match.group(1) == b'c':
+            coordinate = R_ATTRIBUTE.search(match.group(2))
+            if coordinate is None:
+                col_counter += 1
+            else:
+                col_counter = column_index_from_string(coordinate.group(2).decode().rstrip(DIGITS))
+            max_row, max_col = row_counter, max(max_col, col_counter)
+            continue
+        attributes = row_attributes(match.group(2))
+        row_counter = int(float(attributes.get('r', row_counter + 1)))
+        col_counter = 0
+        if set(attributes) - {'r', 'spans'}:
+            height = attributes.get('ht')
+            layout['row_heights'][row_counter] = None if height is None else float(height)
+    layout['dimensions'] = (max_row, max_col)
+    return layout
+
+
+def read_merge_style_ids(ws, merged_cell_ranges, data: bytes):
+    """
+    read_only.read_merge_style_ids for the xml engine, finding the style ids of the corners of the merges with
+    regular expressions over the row and cell tags. Only the cell tags of the rows with a corner are looked at.
+    """
+    corners = read_only.merge_corners(merged_cell_ranges)
+    if not corners:
+        return {}
+    corner_rows = {row for row, _ in corners}
+    last_row = max(corner_rows)
+
+    corner_styles = {}
+    rows = split_sheet_data(data)[1]
+    row_starts = list(ROW_START.finditer(rows))
+    row_counter = 0
+    for i, match in enumerate(row_starts):
+        coordinate = R_ATTRIBUTE.search(match.group(1))
+        row_counter = int(float(coordinate.group(2))) if coordinate else row_counter + 1
+        if row_counter > last_row:
+            break
+        if row_counter not in corner_rows:
+            continue
+        end = row_starts[i + 1].start() if i + 1 < len(row_starts) else len(rows)
+        col_counter = 0
+        for cell in CELL_START.finditer(rows, match.end(), end):
+            coordinate = R_ATTRIBUTE.search(cell.group(1))
+            if coordinate is None:
+                col_counter += 1
+            else:
+                col_counter = column_index_from_string(coordinate.group(2).decode().rstrip(DIGITS))
+            if (row_counter, col_counter) in corners:
+                style_id = S_ATTRIBUTE.search(cell.group(1))
+                corner_styles[(row_counter, col_counter)] = int(style_id.group(2)) if style_id else 0
+    return read_only.merge_style_ids_from_corners(ws.parent, merged_cell_ranges, corner_styles)
+
+
+def iter_rows(ws, data: bytes, min_row: int=None, max_row: int=None, min_col: int=None, max_col: int=None):
+    """
+    The xml engine's version of ws.iter_rows for a read-only worksheet: the same rows, but each cell is either
+    None (a cell missing from the file) or a tuple of its (value, style_id). The values are converted the same
+    way openpyxl converts them, and the unusual cells (formulas, rich inline strings and dates) are handed to openpyxl's parser.
+
+    Arguments:
+    ws: an openpyxl read-only worksheet
+    data: the sheet's XML, from read_sheet_xml
+    min_row, max_row, min_col, max_col: see openpyxl.worksheet.worksheet.Worksheet.iter_rows
+
+    Returns:
+    a generator of tuples, one per row
+    """
+    wb = ws.parent
+    shared_strings = ws._shared_strings
+    data_only = wb.data_only
+    date_formats = wb._date_formats
+    parser = WorkSheetParser(
+        None,
+        shared_strings,
+        data_only=data_only,
+        epoch=wb.epoch,
+        date_formats=date_formats,
+        timedelta_formats=wb._timedelta_formats,
+    )
+
+    def parse_cell(cell, row_counter: int, col_counter: int):
+        parser.row_counter, parser.col_counter = row_counter, col_counter - 1
+        return parser.parse_cell(cell)['value']
+
+    min_row, min_col = min_row or 1, min_col or 1
+    max_row, max_col = max_row or ws.max_row, max_col or ws.max_column
+    empty_row = () if max_col is None else (None,) * (max_col + 1 - min_col)
+
+    counter = min_row
+    row_counter = 0
+    for _, element in iterparse(io.BytesIO(data)):
+        if element.tag != read_only.ROW_TAG:
+            continue
+        row_counter = int(float(element.get('r', row_counter + 1)))
+        if max_row is not None and row_counter > max_row:
+            break
+        for _ in range(counter, row_counter):  # rows missing from the file
+            counter += 1
+            yield empty_row
+        if counter > row_counter:  # above the window
+            element.clear()
+            continue
+        counter += 1
+
+        row_max_col = max_col
+        if row_max_col is None:
+            row_max_col = len(element) and column_index_from_string(element[-1].get('r', 'A').rstrip(DIGITS))
+        cells = [None] * (row_max_col + 1 - min_col) if row_max_col else []
+        col_counter = 0
+        for cell in element:
+            coordinate = cell.get('r')
+            if coordinate is None:
+                col_counter += 1
+            else:
+                col_counter = column_index_from_string(coordinate.rstrip(DIGITS))
+            if not min_col <= col_counter <= row_max_col:
+                continue
+            style_id = cell.get('s')
+            style_id = int(style_id) if style_id else 0
+            data_type = cell.get('t', 'n')
+            if not data_only and cell.find(FORMULA_TAG) is not None:
+                value = parse_cell(cell, row_counter, col_counter)
+            elif data_type == 'inlineStr':
+                inline_string = cell.find(INLINE_STRING_TAG)
+                if inline_string is not None and len(inline_string) == 1 and inline_string[0].tag == TEXT_TAG:
+                    value = inline_string[0].text or ''  # plain text, what openpyxl.cell.text.Text.content comes down to
+                else:
+                    value = parse_cell(cell, row_counter, col_counter)
+            elif style_id in date_formats:
+                value = parse_cell(cell, row_counter, col_counter)
+            else:
+                value = cell.findtext(VALUE_TAG, None) or None
+                if value is not None:
+                    if data_type == 'n':
+                        value = _cast_number(value)
+                    elif data_type == 's':
+                        value = shared_strings[int(value)]
+                    elif data_type == 'b':
+                        value = bool(int(value))
+                    elif data_type == 'd':
+                        value = from_ISO8601(value)
+            cells[col_counter - min_col] = (value, style_id)
+        element.clear()
+        yield tuple(cells)
+
+
+def read_used_range(data: bytes, is_styled):
+    """
+    Finds the last row and column that hold a cell with a value or a visible style, with regular expressions over
+    the row and cell tags, see main.get_used_range. A cell has a value when its tag has any content (<v>, <f> or <is>).
+
+    Arguments:
+    data: the sheet's XML, from read_sheet_xml
+    is_styled: a function of a style id, whether a cell with that style can be seen without a value
+
+    Returns:
+    a tuple of the 1-based (row, column), (0, 0) if there are no such cells
+    """
+    rows = split_sheet_data(data)[1]
+    styled = {}
+    used_row = used_col = row_counter = col_counter = 0
+    for match in ROW_OR_CELL_START.finditer(rows):
+        coordinate = R_ATTRIBUTE.search(match.group(2))
+        if match.group(1) == b'row':
+            row_counter = int(float(coordinate.group(2))) if coordinate else row_counter + 1
+            col_counter = 0
+            continue
+        if coordinate is None:
+            col_counter += 1
+        else:
+            col_counter = column_index_from_string(coordinate.group(2).decode().rstrip(DIGITS))
+        has_value = not match.group(3) and not rows.startswith(b'</', match.end())
+        if not has_value:
+            style_id = S_ATTRIBUTE.search(match.group(2))
+            style_id = int(style_id.group(2)) if style_id else 0
+            if style_id not in styled:
+                styled[style_id] = is_styled(style_id)
+            if not styled[style_id]:
+                continue
+        used_row, used_col = max(used_row, row_counter), max(used_col, col_counter)
+    return used_row, used_col
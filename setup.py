@@ -1,13 +1,18 @@
+import re
 import setuptools
 
 
+with open("excel_to_html/static_values.py") as f:  # read rather than imported, so installing never imports the package
+    version = re.search(r"^VERSION = '(.+)'", f.read(), re.M).group(1)
+
+
 setuptools.setup(
     name="excel_to_html",
     packages=['excel_to_html'],
-    version="1.0.0",
+    version=version,
     description="A package that converts excel sheets to HTML tables",
     url="https://github.com/mwhamilton/excel_to_html",
-    download_url="https://github.com/mwhamilton/excel_to_html/archive/1.0.0.tar.gz",
+    download_url=f"https://github.com/mwhamilton/excel_to_html/archive/{version}.tar.gz",
     author="Matthew Hamilton",
     author_email="mwhamilton6@gmail.com",
     license="MIT",
@@ -17,6 +22,11 @@ setuptools.setup(
         "Programming Language :: Python :: 3.7",
     ],
     include_package_data=True,
+    entry_points={
+        "console_scripts": [
+            "excel-to-html=excel_to_html.cli:cli",
+        ],
+    },
     install_requires=[
         "colorsys",
         "openpyxl",
@@ -0,0 +1,219 @@
+"""
+Benchmarks excel_to_html against synthetic workbooks and compares the results to benchmark_baseline.json.
+
+    python tests/benchmark.py                  # run every scale, exit with 1 on a regression
+    python tests/benchmark.py --scales 1k 10k  # run some of the scales
+    python tests/benchmark.py --update         # store the results as the new baseline
+
+Each phase of main is timed on its own by running the pipeline one stage at a time, then main itself is
+timed end to end and its peak memory is measured with tracemalloc (in a separate run, since tracing slows it down).
+The timings are machine dependent, so update the baseline when moving to another machine.
+"""
+import os
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+import argparse
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+import openpyxl
+from openpyxl.styles import Alignment, Border, Color, Font, PatternFill, Side
+from excel_to_html.main import (
+    load_workbook, load_sheet, iter_sheet_cells, ParsedCell, iter_fixed_rows, to_html, main
+)
+
+
+BASELINE_PATH = pathlib.Path(__file__).with_name('benchmark_baseline.json')
+SCALES = {  # name -> (rows, columns)
+    '1k': (100, 10),
+    '10k': (500, 20),
+    '50k': (1000, 50),
+    '200k': (4000, 50),
+}
+MODES = {  # name -> keyword arguments of main
+    'full': {},
+    'read_only': {'openpyxl_kwargs': {'read_only': True}},
+    'xml': {'engine': 'xml'},
+}
+PHASES = ['load_workbook', 'load_sheet', 'read_cells', 'parse_cells', 'fix_borders', 'render', 'main']
+MIN_REGRESSION = 0.02  # seconds, smaller slowdowns are noise
+
+
+def build_styles(rng: random.Random, count: int):
+    """Makes count random combinations of fonts, fills, borders and alignments, using rgb, theme and indexed colors"""
+    def color():
+        kind = rng.choice(['rgb', 'theme', 'indexed'])
+        if kind == 'rgb':
+            return Color(rgb='FF%06X' % rng.randrange(0x1000000), tint=rng.choice([0, 0, 0.4, -0.25]))
+        if kind == 'theme':
+            return Color(theme=rng.randrange(10), tint=rng.choice([0, 0.8, 0.6, -0.5]))
+        return Color(indexed=rng.randrange(64))
+
+    def side():
+        style = rng.choice([None, None, 'thin', 'medium', 'dashed', 'double', 'thick'])
+        return Side(style=style, color=color() if style else None)
+
+    styles = []
+    for _ in range(count):
+        styles.append({
+            'font': Font(bold=rng.random() < 0.3, italic=rng.random() < 0.2, size=rng.choice([9, 11, 14]), color=color()),
+            'fill': PatternFill('solid', fgColor=color()) if rng.random() < 0.4 else PatternFill(),
+            'border': Border(left=side(), right=side(), top=side(), bottom=side()),
+            'alignment': Alignment(horizontal=rng.choice([None, 'left', 'center', 'right']), vertical=rng.choice([None, 'top', 'center'])),
+        })
+    return styles
+
+
+def build_workbook(pathname: str, rows: int, cols: int, seed: int=0):
+    """
+    Writes a synthetic workbook of rows x cols cells, with dense styles, merged ranges,
+    hyperlinks and custom column widths and row heights.
+    """
+    rng = random.Random(seed)
+    styles = build_styles(rng, 200)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    for r in range(1, rows + 1):
+        for c in range(1, cols + 1):
+            cell = ws.cell(row=r, column=c, value=rng.choice([r * c, f'R{r}C{c}', None, round(rng.random() * 1000, 2)]))
+            style = rng.choice(styles)
+            cell.font = style['font']
+            cell.fill = style['fill']
+            cell.border = style['border']
+            cell.alignment = style['alignment']
+            if rng.random() < 0.01:
+                cell.hyperlink = f'https://example.com/{r}/{c}'
+        if rng.random() < 0.1:
+            ws.row_dimensions[r].height = rng.choice([12, 20, 30])
+    for c in range(1, cols + 1, 3):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(c)].width = rng.choice([8, 13, 20])
+    merged = set()
+    for _ in range(rows * cols // 100):  # about one merge per hundred cells
+        r, c = rng.randrange(1, rows), rng.randrange(1, cols)
+        height, width = rng.choice([(1, 2), (2, 1), (2, 2), (3, 2)])
+        cells = {(r + i, c + j) for i in range(height) for j in range(width)}
+        if r + height - 1 > rows or c + width - 1 > cols or cells & merged:
+            continue
+        merged |= cells
+        ws.merge_cells(start_row=r, start_column=c, end_row=r + height - 1, end_column=c + width - 1)
+    wb.save(pathname)
+
+
+def time_phases(pathname: str, main_kwargs: dict):
+    """Runs the pipeline of main one stage at a time, returning the seconds taken by each"""
+    times = {}
+    start = time.perf_counter()
+    wb, wb_meta = load_workbook(pathname, main_kwargs.get('openpyxl_kwargs'), engine=main_kwargs.get('engine', 'openpyxl'))
+    times['load_workbook'] = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        ws, ws_meta = load_sheet(wb, wb_meta)
+        times['load_sheet'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = [list(row) for row in iter_sheet_cells(ws, ws_meta)]
+        times['read_cells'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed_rows = [[ParsedCell(cell, ws_meta, i, j) for j, cell in enumerate(row) if cell is not None] for i, row in enumerate(rows)]
+        times['parse_cells'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed_rows = list(iter_fixed_rows(parsed_rows))
+        times['fix_borders'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        to_html(parsed_rows)
+        times['render'] = time.perf_counter() - start
+    finally:
+        if wb_meta['read_only']:
+            wb.close()
+
+    start = time.perf_counter()
+    main(pathname, **main_kwargs)
+    times['main'] = time.perf_counter() - start
+    return times
+
+
+def peak_memory(pathname: str, main_kwargs: dict):
+    """The peak memory traced by tracemalloc while main runs, in bytes"""
+    tracemalloc.start()
+    try:
+        main(pathname, **main_kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(scales, modes, repeat: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            pathname = os.path.join(tmp, f'{scale}.xlsx')
+            build_workbook(pathname, *SCALES[scale])
+            for mode in modes:
+                runs = [time_phases(pathname, MODES[mode]) for _ in range(repeat)]
+                result = {phase: min(times[phase] for times in runs) for phase in PHASES}
+                result['peak_memory'] = peak_memory(pathname, MODES[mode])
+                results[f'{scale}/{mode}'] = result
+                print(f'{scale}/{mode}: ' + ', '.join(f'{phase} {result[phase]:.3f}s' for phase in PHASES) + f', peak memory {result["peak_memory"] / 2 ** 20:.1f}MiB', file=sys.stderr)
+    return results
+
+
+def find_regressions(results, baseline, time_tolerance: float, memory_tolerance: float):
+    """
+    Compares the results to the baseline.
+
+    Returns:
+    a list of messages, one per phase (or peak memory) that got slower (or bigger) than the tolerance allows
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for phase in PHASES:
+            old, new = baseline[key].get(phase), result[phase]
+            if old is not None and new > old * time_tolerance and new - old > MIN_REGRESSION:
+                regressions.append(f'{key} {phase}: {new:.3f}s, baseline {old:.3f}s')
+        old, new = baseline[key].get('peak_memory'), result['peak_memory']
+        if old is not None and new > old * memory_tolerance:
+            regressions.append(f'{key} peak memory: {new / 2 ** 20:.1f}MiB, baseline {old / 2 ** 20:.1f}MiB')
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmarks excel_to_html against synthetic workbooks.')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=3, help='the fastest of this many runs is kept (default: 3)')
+    parser.add_argument('--time-tolerance', type=float, default=1.5, help='fail when a phase takes longer than the baseline times this (default: 1.5)')
+    parser.add_argument('--memory-tolerance', type=float, default=1.25, help='fail when the peak memory is larger than the baseline times this (default: 1.25)')
+    parser.add_argument('--update', action='store_true', help='store the results as the baseline instead of comparing them')
+    return parser
+
+
+def benchmark(argv=None):
+    args = build_parser().parse_args(argv)
+    results = run(args.scales, args.modes, args.repeat)
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    if args.update:
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=4, sort_keys=True) + '\n')
+        print(f'Updated {BASELINE_PATH}', file=sys.stderr)
+        return 0
+
+    regressions = find_regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    missing = [key for key in results if key not in baseline]
+    if missing:
+        print(f'No baseline for {", ".join(missing)}, run with --update to store one', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(benchmark())
@@ -3,7 +3,23 @@ import sys
 import pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
 import excel_to_html
+import excel_to_html.cli
+import excel_to_html.server
 import pytest
+import openpyxl
+import io
+import importlib
+import subprocess
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import http.client
+import json
+import re
+import threading
+import tracemalloc
+import zipfile
+import datetime
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 
@@ -16,11 +32,481 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
         ("test.xlsx", {'min_row': 1, 'max_row': 3, 'min_col': 1}, "output4.html"),
         ("test2.xlsx", {}, "output5.html"),
         ("test2.xlsx", {'min_row': 2}, "output6.html"),
+        ("test.xlsx", {'min_row': 7, 'min_col': 3}, "output7.html"),
+        ("test.xlsx", {'style_mode': 'class'}, "output8.html"),
+        ("test.xlsx", {'style_mode': 'compact'}, "output9.html"),
 
     ],
 )
-def test(file_path, kwargs, output):
-    body = excel_to_html.main(file_path, **kwargs)
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test(file_path, kwargs, output, openpyxl_kwargs, engine):
+    body = excel_to_html.main(file_path, openpyxl_kwargs=openpyxl_kwargs, engine=engine, **kwargs)
     with open(output, 'r') as f:
         official_body = f.read()
     assert body == official_body
+
+
+@pytest.mark.parametrize("openpyxl_kwargs", [{}, {'read_only': True}])
+def test_merged_cell_sizes(tmp_path, openpyxl_kwargs):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws.column_dimensions['B'].width = 10
+    ws.column_dimensions['C'].width = 20
+    ws.row_dimensions[2].height = 30
+    ws.row_dimensions[3].height = 45
+    ws['B2'] = 'merged'
+    ws['D4'] = 'corner'
+    ws.merge_cells('B2:C3')
+    wb.save(tmp_path / 'merged.xlsx')
+
+    merged_style = 'width: 210px; height: 100.0px'  # 70px + 140px wide, 40px + 60px high
+    for bounds in [{}, {'min_row': 2, 'min_col': 2}]:
+        body = excel_to_html.main(str(tmp_path / 'merged.xlsx'), openpyxl_kwargs=openpyxl_kwargs, **bounds)
+        assert f'{merged_style}; text-align: left; vertical-align: bottom" rowspan=2 colspan=2>merged</td>' in body
+    body = excel_to_html.main(str(tmp_path / 'merged.xlsx'), openpyxl_kwargs=openpyxl_kwargs, min_row=3, min_col=3)
+    assert 'width: 140px; height: 60.0px; text-align: left; vertical-align: bottom" rowspan=1 colspan=1>merged</td>' in body  # clipped
+
+
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test_row_covered_by_merges(tmp_path, openpyxl_kwargs, engine):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws['A1'] = 'tall'
+    ws.merge_cells('A1:B2')  # row 2 has no cells of its own
+    ws.row_dimensions[2].height = 30
+    ws['A3'] = 'below'
+    wb.save(tmp_path / 'covered.xlsx')
+
+    for style_mode in ['inline', 'class', 'compact']:
+        body = excel_to_html.main(str(tmp_path / 'covered.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, style_mode=style_mode)
+        assert '<tr style="height: 40.0px"></tr>' in body
+        assert body.count('<tr style="height: 15.0px') == 2
+
+
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test_trim_and_collapse_blank_rows(tmp_path, openpyxl_kwargs, engine):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    for row in range(1, 4):
+        for col in range(1, 4):
+            ws.cell(row=row, column=col, value=row * col)
+    ws.cell(row=2, column=5).fill = openpyxl.styles.PatternFill('solid', fgColor='FFFF0000')  # the last used column
+    ws.cell(row=12, column=1).value = 'last'  # the last used row, after a run of 8 blank rows
+    ws.cell(row=5000, column=30).font = openpyxl.styles.Font(bold=True)  # styled, but not visible without a value
+    wb.save(tmp_path / 'messy.xlsx')
+
+    def convert(**kwargs):
+        return excel_to_html.main(str(tmp_path / 'messy.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, **kwargs)
+    body = convert(trim=True)
+    assert (body.count('<tr'), body.count('<td')) == (12, 12 * 5)
+    body = convert(trim=True, collapse_blank_rows=5)
+    assert (body.count('<tr'), body.count('<td')) == (5, 5 * 5)
+    assert 'height: 120.0px' in body  # the 8 blank rows
+    body = convert(trim=True, min_row=2, max_col=2)
+    assert (body.count('<tr'), body.count('<td')) == (11, 11 * 2)
+
+
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test_trim_empty_window(tmp_path, openpyxl_kwargs, engine):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Sheet1'
+    wb.save(tmp_path / 'blank.xlsx')
+    for row in range(1, 4):
+        for col in range(1, 4):
+            wb.active.cell(row=row, column=col, value=row * col)
+    wb.active.cell(row=5, column=5).font = openpyxl.styles.Font(bold=True)  # in the dimensions, but not the used range
+    wb.save(tmp_path / 'small.xlsx')
+
+    for style_mode in ['inline', 'class', 'compact']:
+        for name, kwargs in [('blank.xlsx', {}), ('small.xlsx', {'min_col': 4}), ('small.xlsx', {'min_row': 4}), ('small.xlsx', {'min_row': 4, 'min_col': 4})]:
+            body = excel_to_html.main(str(tmp_path / name), openpyxl_kwargs=openpyxl_kwargs, engine=engine, style_mode=style_mode, trim=True, **kwargs)
+            assert '<tr' not in body and '</table>' in body
+        body = excel_to_html.main(str(tmp_path / 'small.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, style_mode=style_mode, trim=True, min_col=2)
+        assert (body.count('<tr'), body.count('<td')) == (3, 3 * 2)
+
+
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test_format_values(tmp_path, openpyxl_kwargs, engine):
+    values = [
+        (1234.5, '#,##0.00', '1,234.50'),
+        (0.125, '0%', '13%'),
+        (-1234, '"$"#,##0_);("$"#,##0)', '($1,234)'),
+        (0, '0.00', '0.00'),
+        (datetime.datetime(2020, 3, 5), 'd-mmm-yy', '5-Mar-20'),
+        (1.5, '[h]:mm', '36:00'),
+        (0.75, '# ?/?', ' 3/4'),
+        (12345.678, '0.00E+00', '1.23E+04'),
+        (0.1 + 0.2, 'General', '0.3'),
+        (150, '[>=100]"big";"small"', 'big'),
+        ('text', '"x"@', 'xtext'),
+    ]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    for row, (value, number_format, _) in enumerate(values, 1):
+        ws.cell(row=row, column=1, value=value).number_format = number_format
+    wb.save(tmp_path / 'formats.xlsx')
+
+    body = excel_to_html.main(str(tmp_path / 'formats.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, format_values=True)
+    for _, _, shown in values:
+        assert f'>{shown}</td>' in body
+    assert '>0</td>' not in excel_to_html.main(str(tmp_path / 'formats.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine)  # zeros are blank without it
+
+
+def test_single_quoted_attributes(tmp_path):
+    wb = openpyxl.load_workbook("test.xlsx")
+    wb['Sheet1'].row_dimensions[2].height = 40  # read off the <row> tags by the xml engine
+    wb.save(tmp_path / 'double.xlsx')
+
+    def single_quote(tag):
+        return re.sub(rb'="([^"]*)"', rb"='\1'", tag.group(0))
+    with zipfile.ZipFile(tmp_path / 'double.xlsx') as source, zipfile.ZipFile(tmp_path / 'single.xlsx', 'w') as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename.startswith('xl/worksheets/sheet'):
+                data = re.sub(rb'<(?:row|c)\b[^>]*>', single_quote, data)
+            target.writestr(item, data)
+
+    for kwargs in [{}, {'trim': True}, {'min_row': 7, 'min_col': 3}]:
+        expected = excel_to_html.main(str(tmp_path / 'double.xlsx'), **kwargs)
+        for openpyxl_kwargs, engine in [({}, 'openpyxl'), ({'read_only': True}, 'openpyxl'), ({}, 'xml')]:
+            assert excel_to_html.main(str(tmp_path / 'single.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, **kwargs) == expected
+
+
+@pytest.mark.parametrize("openpyxl_kwargs,engine", [({'read_only': True}, 'openpyxl'), ({}, 'xml')])
+def test_missing_or_stale_dimension(tmp_path, openpyxl_kwargs, engine):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Sheet1'
+    wb.active['A1'] = 'merged'
+    wb.active.merge_cells('A1:C1')  # wider than the cells in the file, which are A1 and A3
+    wb.active['A3'] = 'below'
+    wb.save(tmp_path / 'merged.xlsx')
+
+    dimensions = {'missing': b'', 'stale': b'<dimension ref="A1:B3"/>'}
+    for source_name in ['test.xlsx', str(tmp_path / 'merged.xlsx')]:
+        with zipfile.ZipFile(source_name) as source:
+            for name, dimension in dimensions.items():
+                with zipfile.ZipFile(tmp_path / f'{name}.xlsx', 'w') as target:
+                    for item in source.infolist():
+                        data = source.read(item)
+                        if item.filename.startswith('xl/worksheets/sheet'):
+                            data = re.sub(rb'<dimension\b[^>]*/>', dimension, data)
+                        target.writestr(item.filename, data)
+
+        for kwargs in [{}, {'trim': True}, {'min_row': 7, 'min_col': 3}, {'max_row': 5}, {'style_mode': 'compact'}]:
+            expected = excel_to_html.main(source_name, **kwargs)
+            for name in dimensions:
+                assert excel_to_html.main(str(tmp_path / f'{name}.xlsx'), openpyxl_kwargs=openpyxl_kwargs, engine=engine, **kwargs) == expected
+
+
+def test_budget(tmp_path):
+    stats = excel_to_html.ConversionStats()
+    budget = excel_to_html.Budget(max_cells=1000, max_memory=10 ** 8)
+    with open("output1.html", 'r') as f:
+        assert excel_to_html.main("test.xlsx", stats=stats, budget=budget) == f.read()
+    assert 0 < budget.peak_memory == stats.as_dict()['peak_memory']
+
+    with pytest.raises(excel_to_html.BudgetExceeded, match='max_cells'):
+        excel_to_html.main("test.xlsx", budget=excel_to_html.Budget(max_cells=100))
+    with pytest.raises(excel_to_html.BudgetExceeded, match='would need about'):
+        excel_to_html.main("test.xlsx", budget=excel_to_html.Budget(max_memory=10 ** 4))
+
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Sheet1'
+    for row in range(1, 11):
+        wb.active.cell(row=row, column=1, value='x' * 10 ** 5)  # far more than the estimate for 10 cells
+    wb.save(tmp_path / 'long.xlsx')
+    with pytest.raises(excel_to_html.BudgetExceeded, match='allocated'):  # read-only, so the strings are read while tracing
+        excel_to_html.main(str(tmp_path / 'long.xlsx'), openpyxl_kwargs={'read_only': True}, budget=excel_to_html.Budget(max_memory=2 * 10 ** 5))
+
+
+def test_budget_checked_before_full_load(monkeypatch):
+    loads = []
+    load_workbook = openpyxl.load_workbook
+
+    def recording_load_workbook(*args, **kwargs):
+        loads.append(kwargs.get('read_only', False))
+        return load_workbook(*args, **kwargs)
+    monkeypatch.setattr(openpyxl, 'load_workbook', recording_load_workbook)
+    for convert in [
+        lambda budget: excel_to_html.main("test.xlsx", budget=budget),
+        lambda budget: ''.join(excel_to_html.iter_html("test.xlsx", budget=budget)),
+        lambda budget: excel_to_html.convert_many("test.xlsx", ['Sheet1'], budget=budget),
+    ]:
+        loads.clear()
+        with pytest.raises(excel_to_html.BudgetExceeded, match='max_cells'):
+            convert(excel_to_html.Budget(max_cells=100))
+        assert loads == [True]  # only the read-only pass, the full load never happened
+        loads.clear()
+        convert(excel_to_html.Budget(max_cells=1000))
+        assert loads == [True, False]
+
+
+def test_overlapping_budgets():
+    def allocate(sizes):
+        kept = []
+        for size in sizes:
+            kept.append(bytearray(size))
+            yield 'x'
+    first, second = excel_to_html.Budget(), excel_to_html.Budget(max_memory=10 ** 6)
+    first_chunks = first.iter_tracked(allocate([10, 10]))
+    second_chunks = second.iter_tracked(allocate([10, 5 * 10 ** 6, 10]))
+    next(first_chunks)
+    next(second_chunks)
+    assert list(first_chunks) == ['x']  # finishes while the second is still tracing
+    assert tracemalloc.is_tracing()
+    with pytest.raises(excel_to_html.BudgetExceeded, match='allocated'):
+        list(second_chunks)
+    assert second.peak_memory >= 5 * 10 ** 6 and first.peak_memory >= 0
+    assert not tracemalloc.is_tracing()
+
+
+def test_separate_stylesheet():
+    body, css = excel_to_html.main("test.xlsx", style_mode='separate')
+    with open("output8.html", 'r') as f:
+        official_body = f.read()
+    assert f'<style>\n{css}\n</style>{body}' == official_body
+
+
+def test_streaming_output():
+    out = io.StringIO()
+    assert excel_to_html.main("test.xlsx", out=out) is None
+    with open("output1.html", 'r') as f:
+        official_body = f.read()
+    assert out.getvalue() == official_body
+    assert ''.join(excel_to_html.iter_html("test.xlsx")) == official_body
+
+
+@pytest.mark.parametrize("openpyxl_kwargs", [{}, {'read_only': True}])
+def test_convert_many(openpyxl_kwargs):
+    requests = ['Sheet1', ('Sheet1', 1, 3), ('Sheet1', 7, None, 3)]
+    results = excel_to_html.convert_many("test.xlsx", requests, openpyxl_kwargs=openpyxl_kwargs)
+    for request, output in zip(requests, ["output1.html", "output3.html", "output7.html"]):
+        with open(output, 'r') as f:
+            assert results[request] == f.read()
+
+
+def test_cli_convert(tmp_path):
+    (tmp_path / 'broken.xlsx').write_text('not a workbook')
+    exit_code = excel_to_html.cli.cli(['convert', 'test.xlsx', 'test2.xlsx', str(tmp_path / 'broken.xlsx'), '--out-dir', str(tmp_path / 'out'), '--jobs', '2'])
+    assert exit_code == 1  # the broken workbook fails on its own
+    for name, output in [('test.html', 'output1.html'), ('test2.html', 'output5.html')]:
+        with open(output, 'r') as f:
+            assert (tmp_path / 'out' / name).read_text() == f.read()
+
+
+def test_server():
+    converter = excel_to_html.server.ConversionServer(jobs=1, cache_size=2, max_upload=os.path.getsize("test.xlsx"))
+    converter.start()
+    httpd = excel_to_html.server.make_server(converter, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def request(method, url, body=None, headers=None):
+        connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+        connection.request(method, url, body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.getheader('X-Workbook-Cache'), response.read().decode('utf-8')
+    try:
+        outputs = {}
+        for output in ["output1.html", "output3.html", "output8.html"]:
+            with open(output, 'r') as f:
+                outputs[output] = f.read()
+        json_headers = {'Content-Type': 'application/json'}
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx'}), json_headers) == (200, 'miss', outputs["output1.html"])
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx', 'min_row': 1, 'max_row': 3}), json_headers) == (200, 'hit', outputs["output3.html"])
+        with open("test.xlsx", 'rb') as f:
+            assert request('POST', '/convert?style_mode=class', f.read()) == (200, 'miss', outputs["output8.html"])
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx', 'sheetname': 'missing'}), json_headers)[0] == 400
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx', 'max_cells': 100}), json_headers)[0] == 413
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx', 'min_row': 'x'}), json_headers)[0] == 400
+        assert request('POST', '/convert', b'x' * (converter.max_upload + 1))[0] == 413
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx', 'max_row': '3', 'min_row': 1}), json_headers) == (200, 'hit', outputs["output3.html"])
+
+        for process in list(converter.pool._processes.values()):  # as if the worker ran out of memory
+            process.kill()
+            process.join()
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx'}), json_headers)[0] == 503
+        assert request('POST', '/convert', json.dumps({'path': 'test.xlsx'}), json_headers) == (200, 'miss', outputs["output1.html"])  # on a new pool
+
+        status, _, body = request('GET', '/metrics')
+        metrics = json.loads(body)
+        assert status == 200 and metrics['queue_depth'] == 0 and metrics['worker_restarts'] == 1
+        assert (metrics['completed'], metrics['failed'], metrics['workbook_cache_hits']) == (5, 3, 2)
+        assert metrics['latency']['count'] == 5 and metrics['latency']['max'] >= metrics['convert_time']['max']
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        converter.close()
+
+
+@pytest.mark.skipif(not hasattr(excel_to_html.server, 'UnixServer'), reason='no Unix sockets')
+def test_server_unix_socket_path(tmp_path):
+    converter = excel_to_html.server.ConversionServer(jobs=1)
+    path = tmp_path / 'server.sock'
+    path.write_text('not a socket')
+    with pytest.raises(FileExistsError):
+        excel_to_html.server.make_server(converter, unix_socket=str(path))
+    assert path.read_text() == 'not a socket'
+
+    path.unlink()
+    for _ in range(2):  # the second one replaces the socket the first one left behind
+        httpd = excel_to_html.server.make_server(converter, unix_socket=str(path))
+        httpd.server_close()
+        assert excel_to_html.server.is_socket(str(path))
+
+
+def test_cli_output_names_and_dead_workers():
+    paths = ['a_x.xlsx', os.path.join('a', 'x.xlsx'), os.path.join('b', 'x.xlsx')]
+    stems = excel_to_html.cli.output_stems(paths)
+    assert len(set(stems.values())) == 3 and stems['a_x.xlsx'] == 'a_x'
+
+    future = concurrent.futures.Future()
+    future.set_exception(concurrent.futures.process.BrokenProcessPool('a worker died'))
+    task = ('test.xlsx', 'test', None, False)
+    assert excel_to_html.cli.task_result(future, task) == (task, [], 'BrokenProcessPool: a worker died', 0.0)
+
+
+def test_stats():
+    stats = excel_to_html.ConversionStats()
+    body = excel_to_html.main("test.xlsx", stats=stats)
+    with open("output1.html", 'r') as f:
+        assert body == f.read()
+    result = stats.as_dict()
+    assert result['output_bytes'] == len(body.encode('utf-8'))
+    assert result['merged_ranges'] == 5 and result['cells'] > 0 and result['distinct_styles'] > 0
+    assert abs(result['time_total'] - sum(v for k, v in result.items() if k.startswith('time_') and k != 'time_total')) < 1e-9
+
+
+def test_cache(tmp_path, monkeypatch):
+    cache = excel_to_html.HTMLCache(str(tmp_path / 'cache.sqlite'))
+    with open("output8.html", 'r') as f:
+        official_body = f.read()
+    assert excel_to_html.main("test.xlsx", style_mode='class', cache=cache) == official_body
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the workbook was loaded')
+    monkeypatch.setattr(importlib.import_module('excel_to_html.main'), 'load_workbook', fail)
+    assert excel_to_html.main("test.xlsx", style_mode='class', cache=cache) == official_body
+    assert excel_to_html.convert_many("test.xlsx", ['Sheet1'], style_mode='class', cache=cache) == {'Sheet1': official_body}
+    for kwargs in [{'openpyxl_kwargs': {'read_only': True}}, {'engine': 'xml'}]:  # converted on their own, not served from the full mode result
+        with pytest.raises(AssertionError):
+            excel_to_html.main("test.xlsx", style_mode='class', cache=cache, **kwargs)
+        with pytest.raises(AssertionError):
+            excel_to_html.convert_many("test.xlsx", ['Sheet1'], style_mode='class', cache=cache, **kwargs)
+
+    small_cache = excel_to_html.HTMLCache(str(tmp_path / 'cache.sqlite'), max_bytes=len(official_body.encode('utf-8')))
+    small_cache.put('other', 'x')  # evicts the least recently used entry
+    assert small_cache.get('other') == ('x', None)
+    with pytest.raises(AssertionError):
+        excel_to_html.main("test.xlsx", style_mode='class', cache=cache)
+
+
+def test_convert_async(monkeypatch):
+    main_module = importlib.import_module('excel_to_html.main')
+    loads = []
+    load_workbook = main_module.load_workbook
+
+    def counting_load_workbook(*args, **kwargs):
+        loads.append(args[0])
+        return load_workbook(*args, **kwargs)
+    monkeypatch.setattr(main_module, 'load_workbook', counting_load_workbook)
+
+    async def convert():
+        converter = excel_to_html.AsyncConverter(max_concurrency=1)
+        return await asyncio.gather(
+            converter.convert("test.xlsx"),
+            converter.convert("test.xlsx"),  # shares the first conversion
+            excel_to_html.convert_async("test.xlsx", style_mode='class', converter=converter),
+        )
+    outputs = []
+    for output in ["output1.html", "output1.html", "output8.html"]:
+        with open(output, 'r') as f:
+            outputs.append(f.read())
+    assert asyncio.run(convert()) == outputs
+    assert len(loads) == 2
+
+    async def cancel():
+        converter = excel_to_html.AsyncConverter()
+        caller = asyncio.ensure_future(converter.convert("test.xlsx"))
+        await asyncio.sleep(0)
+        conversion = converter.in_flight[next(iter(converter.in_flight))]
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        assert conversion['cancel_event'].is_set() and conversion['task'].cancelled()
+        await asyncio.sleep(0)  # the done callbacks run on the next iteration of the loop
+        assert not converter.in_flight
+    asyncio.run(cancel())
+
+
+def test_convert_async_cancelled_keeps_its_slot(monkeypatch):
+    async_api = importlib.import_module('excel_to_html.async_api')
+    release = threading.Event()
+    started = []
+
+    def slow_convert(pathname, *args):
+        started.append(pathname)
+        if pathname == 'a':
+            release.wait(5)  # still busy after being cancelled, like a workbook load
+        return pathname
+    monkeypatch.setattr(async_api, 'convert_blocking', slow_convert)
+
+    async def convert():
+        converter = excel_to_html.AsyncConverter(concurrent.futures.ThreadPoolExecutor(2), max_concurrency=1)
+        first = asyncio.ensure_future(converter.convert('a'))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        second = asyncio.ensure_future(converter.convert('b'))
+        await asyncio.sleep(0.1)
+        assert started == ['a']  # 'a' is still running, so 'b' waits for its slot
+        release.set()
+        assert await second == 'b'
+    asyncio.run(convert())
+
+
+def test_incremental_render(tmp_path):
+    wb = openpyxl.load_workbook("test.xlsx")
+    wb.save(tmp_path / 'before.xlsx')
+    wb['Sheet1'].cell(row=10, column=3).value = 'changed'
+    wb.save(tmp_path / 'after.xlsx')
+
+    renderer = excel_to_html.IncrementalRenderer()
+    for name, rendered_rows in [('before.xlsx', 22), ('after.xlsx', 3), ('after.xlsx', 0), ('before.xlsx', 3)]:
+        body = renderer.render(str(tmp_path / name))
+        assert body == excel_to_html.main(str(tmp_path / name))
+        assert renderer.rendered_rows == rendered_rows
+
+
+IMPORT_TIME_BUDGET = 0.15  # seconds, openpyxl and jinja2 alone take longer than this
+
+
+def test_import_time():
+    script = (
+        "import sys, time; start = time.perf_counter(); import excel_to_html; elapsed = time.perf_counter() - start; "
+        "print(elapsed, 'openpyxl' in sys.modules, 'jinja2' in sys.modules)"
+    )
+    runs = []
+    for _ in range(3):
+        output = subprocess.run([sys.executable, '-c', script], cwd=pathlib.Path(__file__).parents[1], capture_output=True, text=True, check=True).stdout.split()
+        runs.append(float(output[0]))
+        assert output[1:] == ['False', 'False']  # deferred until the first conversion
+    assert min(runs) < IMPORT_TIME_BUDGET
+
+
+def test_import_beside_another_main(tmp_path):
+    for name in ['main.py', 'read_only.py', 'xml_engine.py']:  # an application's own modules, found before the package's
+        (tmp_path / name).write_text('')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([str(tmp_path), str(pathlib.Path(__file__).parents[1])])}
+    convert = 'import excel_to_html; excel_to_html.main({!r}, openpyxl_kwargs={}, engine={!r})'
+    for openpyxl_kwargs, engine in [({'read_only': True}, 'openpyxl'), ({}, 'xml')]:
+        code = convert.format(os.path.abspath('test.xlsx'), openpyxl_kwargs, engine)
+        subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, check=True)
+
+
+def test_warmup():
+    excel_to_html.warmup()
+    assert 'openpyxl' in sys.modules and 'jinja2' in sys.modules
+    assert importlib.import_module('excel_to_html.main').get_table_template.cache_info().currsize == 2